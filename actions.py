@@ -1,18 +1,46 @@
-import csv
 import os
 import re
-from datetime import datetime
 
-import aiohttp
-import pandas as pd
-from discord.utils import get
-from pdf2image import convert_from_bytes
-from PIL import Image
-
-from config import CSV_FILE, GUILD_ID
-
-
-async def process_csv_add(client):
+import discord
+
+from concurrency import run_bounded, with_retries
+from config import (
+    CSV_FILE,
+    GUILD_ID,
+    MOODLE_ZIP,
+    SLIDES_CACHE_DIR,
+    STATE_FILE,
+    STATS_LONG_FORMAT,
+    STATS_ROLLING_WINDOW,
+    STATS_STATE_FILE,
+    THUMBNAIL_FORMAT,
+)
+from planner import (
+    PIN,
+    PINNED_FIELDS,
+    UPDATE_PIN,
+    GuildIndex,
+    apply_changes,
+    load_desired_state,
+    plan_add,
+    plan_remove,
+    print_plan,
+)
+from schedule import ScheduleError
+from snapshot import GuildSnapshot
+from state import ExportManifest, HistoryCursors, StateCache, write_text_atomic
+
+
+async def process_csv_add(
+    client,
+    dry_run=False,
+    rebuild_cache=False,
+    record_ids=None,
+    snapshot=None,
+    guild_id=None,
+    csv_file=None,
+    state_file=None,
+):
     """
     Reads the CSV file and for each record:
       - Parses the date (e.g., "Monday, April 7, 2025")
@@ -20,470 +48,413 @@ async def process_csv_add(client):
       - If "Discord Channel Name" is provided:
           - Creates the channel if it doesn't exist, or
           - If the channel exists, checks for a pinned message from the bot.
-            If no message is pinned or if the pinned message's content differs from
-            the expected content, updates it.
+            If no message is pinned, sends and pins one; if the pinned message's
+            content differs from the expected content, edits it in place.
       - The message includes the presentation date (with a calendar emoji) along with other details.
+    The guild is indexed once and diffed against the CSV (see planner.py); only the
+    resulting changes are applied. With dry_run, the change set is printed instead.
+    Channels recorded in the local state cache (STATE_FILE) are compared by content
+    hash without fetching their pins; rebuild_cache discards the cache first.
+    With record_ids, only those CSV rows (and their categories) are reconciled.
+    Pins already in a GuildSnapshot are not fetched again.
+    guild_id, csv_file and state_file default to GUILD_ID, CSV_FILE and STATE_FILE.
+    Returns the changes that failed, or None if nothing could be planned.
     """
-    guild = client.get_guild(GUILD_ID)
+    guild_id = guild_id or GUILD_ID
+    csv_file = csv_file or CSV_FILE
+    state_file = state_file or STATE_FILE
+    guild = client.get_guild(guild_id)
     if guild is None:
         print("Guild not found!")
-        return
-
-    categories = {}  # Cache for category objects
+        return None
 
     try:
-        assert CSV_FILE is not None, "CSV_FILE environment variable is required."
-        with open(CSV_FILE, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for record in reader:
-                date_str = record.get("Date", "").strip()
-                if not date_str:
-                    continue  # Skip if no date
-
-                try:
-                    dt = datetime.strptime(date_str, "%A, %B %d, %Y")
-                except Exception as e:
-                    print(f"Error parsing date '{date_str}': {e}")
-                    continue
-
-                month_name = dt.strftime("%B")
-                category_name = f"{month_name} Presentations"
-
-                # Retrieve or create the category
-                if category_name in categories:
-                    category = categories[category_name]
-                else:
-                    category = get(guild.categories, name=category_name)
-                    if category is None:
-                        print(f"Creating category: {category_name}")
-                        category = await guild.create_category(category_name)
-                    categories[category_name] = category
-
-                discord_channel_name = record.get("Discord Channel Name", "").strip()
-                if discord_channel_name:
-                    channel_id = record.get("ID", "").strip()
-                    if not channel_id:
-                        print("No ID provided; skipping record.")
-                        continue
-
-                    channel_name = f"p{channel_id}-{discord_channel_name}"
-
-                    paper_title = record.get("Paper Title", "No Title").strip()
-                    paper_link = record.get("Paper Link", "No Link").strip()
-                    presenter = record.get("Presenters", "N/A").strip()
-                    topic_category = record.get("Topic", "N/A").strip()
-                    presentation_date = dt.strftime("%A, %B %d, %Y")
-                    new_message_content = (
-                        f"**📜 Paper being presented**: {paper_title}\n"
-                        f"**🌐 Paper Link**: {paper_link}\n"
-                        f"**📅 Presentation Date**: {presentation_date}\n"
-                        f"**🗣️ Presenter(s)**: {presenter}\n"
-                        f"**🗃️ Topic Category**: {topic_category}"
-                    )
-
-                    existing_channel = get(category.channels, name=channel_name)
-                    if existing_channel is None:
-                        print(f"Creating channel: {channel_name} in {category_name}")
-                        channel = await guild.create_text_channel(
-                            channel_name, category=category
-                        )
-                        try:
-                            msg = await channel.send(new_message_content)
-                            await msg.pin()
-                            print(
-                                f"Sent and pinned message in channel '{channel_name}'."
-                            )
-                        except Exception as e:
-                            print(f"Error in channel '{channel_name}': {e}")
-                    else:
-                        channel = existing_channel
-                        try:
-                            pinned_messages = await channel.pins()
-                        except Exception as e:
-                            print(f"Error retrieving pins in '{channel_name}': {e}")
-                            pinned_messages = []
-
-                        target_message = None
-                        for m in pinned_messages:
-                            if m.author.id == client.user.id:
-                                target_message = m
-                                break
-
-                        if target_message is None:
-                            try:
-                                msg = await channel.send(new_message_content)
-                                await msg.pin()
-                                print(
-                                    f"Sent and pinned new message in '{channel_name}'."
-                                )
-                            except Exception as e:
-                                print(f"Error in '{channel_name}': {e}")
-                        elif target_message.content != new_message_content:
-                            try:
-                                await target_message.delete()
-                                msg = await channel.send(new_message_content)
-                                await msg.pin()
-                                print(f"Updated pinned message in '{channel_name}'.")
-                            except Exception as e:
-                                print(
-                                    f"Error updating message in '{channel_name}': {e}"
-                                )
-                        else:
-                            print(f"Channel '{channel_name}' is up-to-date. Skipping.")
+        assert csv_file is not None, "CSV_FILE environment variable is required."
+        category_names, desired = load_desired_state(csv_file)
     except FileNotFoundError:
-        print(f"CSV file '{CSV_FILE}' not found.")
+        print(f"CSV file '{csv_file}' not found.")
+        return None
+    except ScheduleError as e:
+        print(e)
+        return None
+
+    if record_ids is not None:
+        desired = [item for item in desired if item.record_id in record_ids]
+        wanted = {item.category_name for item in desired}
+        category_names = [name for name in category_names if name in wanted]
+
+    state = StateCache(state_file)
+    if rebuild_cache:
+        print(f"Rebuilding state cache '{state_file}' from the guild.")
+        state.rebuild()
+
+    index = GuildIndex(guild)
+    changes = await plan_add(
+        category_names, desired, index, client.user.id, state, snapshot
+    )
+    print_plan(changes)
+    if dry_run:
+        return []
+    failed = await apply_changes(index, changes, state)
+    state.save()
+    if snapshot is not None:
+        # New channels are picked up by the next refresh; re-read edited pins.
+        snapshot.invalidate(
+            c.channel.id for c in changes if c.kind in (PIN, UPDATE_PIN)
+        )
+    return failed
 
 
-async def process_csv_remove(client):
+async def process_csv_remove(
+    client, dry_run=False, archive=False, guild_id=None, csv_file=None, state_file=None
+):
     """
     Reads the CSV file and for each record:
       - Parses the date and determines the category.
       - If the channel "p{ID}-{Discord Channel Name}" exists, removes it.
-    Then, removes any empty categories.
+    Then, removes any categories left empty by those removals.
+    The channels are removed as one concurrent batch (see planner.apply_changes).
+    With archive, they are moved into the archive category instead of deleted.
+    With dry_run, the planned removals are printed instead.
+    guild_id, csv_file and state_file default to GUILD_ID, CSV_FILE and STATE_FILE.
+    Returns the changes that failed, or None if nothing could be planned.
     """
-    guild = client.get_guild(GUILD_ID)
+    guild_id = guild_id or GUILD_ID
+    csv_file = csv_file or CSV_FILE
+    state_file = state_file or STATE_FILE
+    guild = client.get_guild(guild_id)
     if guild is None:
         print("Guild not found!")
-        return
+        return None
 
-    categories = {}
     try:
-        assert CSV_FILE is not None, "CSV_FILE environment variable is required."
-        with open(CSV_FILE, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for record in reader:
-                date_str = record.get("Date", "").strip()
-                if not date_str:
-                    continue
-
-                try:
-                    dt = datetime.strptime(date_str, "%A, %B %d, %Y")
-                except Exception as e:
-                    print(f"Error parsing date '{date_str}': {e}")
-                    continue
-
-                month_name = dt.strftime("%B")
-                category_name = f"{month_name} Presentations"
-                category = get(guild.categories, name=category_name)
-                if category is None:
-                    print(f"Category '{category_name}' not found; skipping record.")
-                    continue
-                categories[category_name] = category
-
-                discord_channel_name = record.get("Discord Channel Name", "").strip()
-                if discord_channel_name:
-                    channel_id = record.get("ID", "").strip()
-                    if not channel_id:
-                        print("No ID provided; skipping record.")
-                        continue
-
-                    channel_name = f"p{channel_id}-{discord_channel_name}"
-                    channel = get(category.channels, name=channel_name)
-                    if channel is not None:
-                        try:
-                            print(
-                                f"Removing channel '{channel_name}' from '{category_name}'."
-                            )
-                            await channel.delete()
-                        except Exception as e:
-                            print(f"Error removing channel '{channel_name}': {e}")
-                    else:
-                        print(
-                            f"Channel '{channel_name}' not found in '{category_name}'."
-                        )
+        assert csv_file is not None, "CSV_FILE environment variable is required."
+        category_names, desired = load_desired_state(csv_file)
     except FileNotFoundError:
-        print(f"CSV file '{CSV_FILE}' not found.")
-
-    # Remove empty categories
-    for category_name, category in categories.items():
-        if len(category.channels) == 0:
-            try:
-                print(f"Removing empty category '{category_name}'.")
-                await category.delete()
-            except Exception as e:
-                print(f"Error removing category '{category_name}': {e}")
-                await category.delete()
-
-
-async def process_stats(client):
+        print(f"CSV file '{csv_file}' not found.")
+        return None
+    except ScheduleError as e:
+        print(e)
+        return None
+
+    index = GuildIndex(guild)
+    changes = plan_remove(category_names, desired, index, archive=archive)
+    print_plan(changes)
+    if dry_run:
+        return []
+    state = StateCache(state_file)
+    failed = await apply_changes(index, changes, state)
+    state.save()
+    return failed
+
+
+async def process_stats(client, output_prefix="stats", snapshot=None):
     """
-    For each text channel in the guild that (optionally) follows the presentation naming convention,
-    the function:
-      1. Retrieves pinned messages to find the one posted by the bot that contains the "Presentation Date".
-      2. Extracts the presentation date from the pinned message.
-      3. Iterates over the channel's message history and records each user (non-bot) who has posted a message.
+    For each presentation channel in the guild snapshot (see snapshot.py), the function:
+      1. Takes the presentation date from the bot's pinned message, as parsed by the snapshot.
+      2. Iterates over the channel's message history and records each user (non-bot) who has posted a message.
     Finally, it builds a table where:
       - Rows represent user names,
       - Columns represent presentation dates (with a suffix for duplicate dates, e.g. "Date-0", "Date-1"),
       - Cells are binary (1 if the user has posted any message for that presentation date; 0 otherwise).
-    The table is printed and also saved as CSV ("stats.csv").
+    The table is printed and also saved as CSV ("stats.csv"), next to per-user totals
+    ("stats_users.csv") and per-session attendance ("stats_sessions.csv").
+    The same history pass also aggregates per-user message counts with first/last
+    activity ("stats_messages.csv") and hourly message counts ("stats_activity.csv"),
+    and the same participation in long form with typed columns for analysis
+    ("stats_long.parquet" with pyarrow installed, else "stats_long.csv"; see
+    stats.export_long and STATS_LONG_FORMAT).
+    Users are tracked by id and only resolved to names when exporting.
+    Channels are scanned concurrently, and a per-channel cursor (STATS_STATE_FILE)
+    means later runs only fetch messages posted since the previous run.
+    output_prefix replaces "stats" in the names of the files written. A given
+    snapshot is refreshed and reused instead of reading every channel's pins.
     """
+    # pandas and numpy are only needed here, so --add and --remove skip them.
+    from stats import (
+        ChannelActivity,
+        ParticipationMatrix,
+        export_activity,
+        export_long,
+        export_stats,
+        resolve_names,
+    )
+
     guild = client.get_guild(GUILD_ID)
     if guild is None:
         print("Guild not found!")
         return
 
-    # Dictionary mapping presentation date (string) to a set of users who have posted
-    stats = {}
-
-    # Keep track of date occurrences to handle duplicates
-    date_counters = {}
-
-    # Iterate over all text channels in the guild.
-    # If you want to restrict to channels created for presentations, you could filter by name prefix (e.g., "p").
-    for channel in guild.text_channels:
-        # Optionally filter channels by naming convention; uncomment if needed:
-        if (
-            not channel.name.startswith("p")
-            or not channel.name[1:].split("-", 1)[0].isdigit()
-        ):
-            continue
-
-        print(f"Processing channel: {channel.name}")
-
-        try:
-            pinned_messages = await channel.pins()
-        except Exception as e:
-            print(f"Error retrieving pins in channel '{channel.name}': {e}")
-            continue
-
-        presentation_date = None
-        # Look for the pinned message sent by the bot that includes the presentation date.
-        for msg in pinned_messages:
-            if msg.author.id == client.user.id:
-                for line in msg.content.splitlines():
-                    if line.startswith("**📅 Presentation Date**:"):
-                        # Get text after the label; expect format: "**📅 Presentation Date**: {date}"
-                        presentation_date = line.split("**📅 Presentation Date**:")[
-                            1
-                        ].strip()
-                        break
-            if presentation_date:
-                break
-
-        if presentation_date is None:
-            print(f"No presentation date found for channel '{channel.name}'; skipping.")
-            continue
-
-        # Make date unique by adding counter suffix
-        if presentation_date not in date_counters:
-            date_counters[presentation_date] = 0
-        else:
-            date_counters[presentation_date] += 1
-
-        unique_date = f"{presentation_date}-{date_counters[presentation_date]}"
-        print(
-            f"  Found presentation date: {presentation_date} (using as {unique_date})"
-        )
-
-        # Initialize set for this unique presentation date
-        stats[unique_date] = set()
-
-        # Process all messages in the channel's history.
-        try:
-            async for msg in channel.history(limit=None):
-                # Only consider messages by non-bot users.
-                if not msg.author.bot:
-                    stats[unique_date].add(msg.author.name)
-        except Exception as e:
-            print(f"Error retrieving history for channel '{channel.name}': {e}")
-            continue
-
-        print(
-            f"    Found {len(stats[unique_date])} unique users for date '{unique_date}'."
-        )
-
-    # Combine data into a table:
-    # Determine the full set of users across all presentation dates.
-    all_users = set()
-    for users in stats.values():
-        all_users |= users
-
-    # Sort the presentation dates based on the actual date part (before the -N suffix)
-    try:
-        sorted_dates = sorted(
-            stats.keys(),
-            key=lambda d: (
-                datetime.strptime(d.split("-")[0], "%A, %B %d, %Y"),
-                int(d.split("-")[-1]),
-            ),
-        )
-    except Exception as e:
-        print(
-            f"Error sorting dates; ensure all dates follow the expected format. Using unsorted dates. Error: {e}"
-        )
-        sorted_dates = list(stats.keys())
-
-    sorted_users = sorted(all_users)
-
-    data = []
-    for user in sorted_users:
-        row = {"User": user}
-        for pres_date in sorted_dates:
-            # Mark 1 if the user posted in that presentation's channel, 0 otherwise.
-            row[pres_date] = 1 if user in stats[pres_date] else 0
-        data.append(row)
+    cursors = HistoryCursors(STATS_STATE_FILE)
+    snapshot = await load_snapshot(guild, client, snapshot)
+
+    # The sessions are the snapshot's presentation dates; channels sharing a
+    # date get "-0", "-1", ... suffixes in channel order.
+    sessions_by_date = sorted(snapshot.by_date.items())
+    channels = [entry.channel for _, entries in sessions_by_date for entry in entries]
+    for entry in snapshot.by_id.values():
+        if entry.loaded and (entry.details is None or entry.details.date is None):
+            print(
+                f"No presentation date found for channel '{entry.channel.name}'; skipping."
+            )
 
-    df = pd.DataFrame(data)
-    df.set_index("User", inplace=True)
+    # channel id -> ChannelActivity of its non-bot posters
+    scanned = {}
+
+    async def scan_channel(channel):
+        # Only messages newer than the stored cursor need to be fetched; the
+        # participants seen before it are restored from disk.
+        last_message_id, activity_data = cursors.get(channel.id)
+        activity = ChannelActivity(activity_data)
+        after = discord.Object(id=last_message_id) if last_message_id else None
+        new_messages = 0
+        async for msg in channel.history(limit=None, after=after):
+            new_messages += 1
+            last_message_id = max(last_message_id or 0, msg.id)
+            # Only consider messages by non-bot users.
+            if not msg.author.bot:
+                activity.add(msg.author.id, msg.created_at)
+                cursors.names[str(msg.author.id)] = msg.author.name
+
+        # The cursor only advances once the whole history page run succeeded.
+        cursors.set(channel.id, last_message_id, activity.to_dict())
+        scanned[channel.id] = activity
+        print(f"Processed channel: {channel.name} ({new_messages} new messages)")
+
+    failures = await run_bounded(
+        channels,
+        lambda channel: with_retries(
+            scan_channel, channel, label=f"Scanning channel '{channel.name}'"
+        ),
+    )
+    for channel, e in failures:
+        print(f"Error retrieving history for channel '{channel.name}': {e}")
+    cursors.save()
+
+    # Dictionary mapping session label ("{date}-{N}") to the activity of its channel
+    stats = {}
+    # The same keys mapped to (date, record id, channel name) for the long table
+    sessions = {}
+
+    # Sessions come out in date order; a channel keeps its suffix even when
+    # the scan of another channel on the same date failed.
+    for _, entries in sessions_by_date:
+        for suffix, entry in enumerate(entries):
+            activity = scanned.get(entry.channel.id)
+            if activity is None:
+                continue
+            label = f"{entry.details.date_text}-{suffix}"
+            stats[label] = activity
+            sessions[label] = (entry.details.date, entry.record_id, entry.channel.name)
+            print(
+                f"  {entry.channel.name}: {len(activity.users)} unique users for date '{label}'."
+            )
+    sorted_dates = list(stats)
+
+    # Participation is kept as (user, session) index pairs; names are resolved
+    # only for the exported tables.
+    matrix = ParticipationMatrix()
+    for pres_date in sorted_dates:
+        matrix.add_session(pres_date, stats[pres_date].users)
+    names = resolve_names(matrix.user_ids, guild, cursors.names)
+
+    df = export_stats(matrix, names, STATS_ROLLING_WINDOW, prefix=output_prefix)
+    messages = export_activity(
+        [(d, stats[d]) for d in sorted_dates], names, output_prefix
+    )
+    if STATS_LONG_FORMAT != "none":
+        export_long(messages, sessions, output_prefix, STATS_LONG_FORMAT)
 
     # Print the results to console.
     print("\nStatistics Table:")
     print(df)
 
-    # Save the table to a CSV file.
-    csv_filename = "stats.csv"
-    df.to_csv(csv_filename)
-    print(f"Saved stats table to '{csv_filename}'.")
-
 
-async def process_moodle(client):
+async def process_moodle(
+    client, moodle_dir="moodle", snapshot=None, zip_path=MOODLE_ZIP
+):
     """
-    Creates a "moodle" folder.
+    Creates a "moodle" folder (or moodle_dir).
     For each channel whose name starts with 'p' followed by an integer (e.g., p20 or p1),
     creates a subdirectory (named as the channel) within the moodle folder that contains:
       - A text file with the pinned message by the presentation bot.
       - For each message containing a Google Slides URL, downloads the slides as a PDF,
-        then extracts the first page as a PNG thumbnail resized to a width of 150 pixels
+        then extracts the first page as a PNG thumbnail resized to a width of 720 pixels
         while preserving the aspect ratio.
+    Slide URLs are discovered first; the downloads then run concurrently through a
+    single pooled HTTP session (see slides.download_slides).
+    Each channel directory keeps a manifest of the last message scanned and the
+    artifacts produced, so re-runs only read newer messages and finish any deck an
+    interrupted run left incomplete. Decks already exported are re-checked with a
+    conditional request and re-exported only if they changed. Slides are numbered oldest first so numbers
+    stay stable as new decks are posted.
+    With zip_path, the same content goes into a single zip file with an index.json
+    instead (see slides.write_bundle); moodle_dir then only holds the manifests.
+    The channels and their pins come from the guild snapshot (see snapshot.py).
     """
+    # pdf2image and Pillow are only needed here.
+    from slides import (
+        THUMBNAIL_FORMATS,
+        SlideCache,
+        SlideJob,
+        download_slides,
+        find_presentation_ids,
+        write_bundle,
+    )
+
+    # Checked before any channel is scanned rather than once downloads start.
+    if THUMBNAIL_FORMAT.lower() not in THUMBNAIL_FORMATS:
+        print(
+            f"Unknown THUMBNAIL_FORMAT '{THUMBNAIL_FORMAT}'; "
+            f"expected one of {', '.join(THUMBNAIL_FORMATS)}."
+        )
+        return
+
     guild = client.get_guild(GUILD_ID)
     if guild is None:
         print("Guild not found!")
         return
 
     # Create the main moodle folder if it does not exist.
-    moodle_dir = "moodle"
     os.makedirs(moodle_dir, exist_ok=True)
 
-    # Regular expression to match channels that start with "p" followed by one or more digits.
-    channel_pattern = re.compile(r"^p\d+")
+    # A bundle is assembled from the slide cache, so a deck counts as exported
+    # once its artifacts are cached rather than once they are in channel_dir.
+    cache = SlideCache(SLIDES_CACHE_DIR) if zip_path else None
 
-    # Iterate over all text channels.
-    for channel in guild.text_channels:
-        if not channel_pattern.match(channel.name):
-            continue
-
-        print(f"\nProcessing channel: {channel.name}")
+    snapshot = await load_snapshot(guild, client, snapshot)
+    # One channel per presentation record.
+    channels = []
+    for entry in snapshot.by_id.values():
         # Create a subdirectory for the current channel.
-        channel_dir = os.path.join(moodle_dir, channel.name)
-        if os.path.isdir(channel_dir):
-            print(f"Directory for channel '{channel.name}' exists, skipping it.")
-            continue
+        channel_dir = os.path.join(moodle_dir, entry.channel.name)
         os.makedirs(channel_dir, exist_ok=True)
+        channels.append((entry, channel_dir))
+
+    jobs = []
+    manifests = {}  # record id -> ExportManifest
+
+    async def scan_history(channel, channel_dir):
+        # The manifest is re-read on every attempt, so a retry after a failed
+        # page starts again from the last saved message.
+        manifest = ExportManifest(channel_dir)
+        after = (
+            discord.Object(id=manifest.last_message_id)
+            if manifest.last_message_id
+            else None
+        )
+        async for msg in channel.history(limit=None, after=after, oldest_first=True):
+            for presentation_id in find_presentation_ids(msg.content):
+                manifest.add_slides(presentation_id, msg.id)
+            manifest.last_message_id = msg.id
+        manifest.save()
+        return manifest
+
+    async def discover(item):
+        entry, channel_dir = item
+        channel = entry.channel
+        print(f"Processing channel: {channel.name}")
 
-        # Retrieve pinned messages in the channel.
-        try:
-            pinned_messages = await channel.pins()
-        except Exception as e:
-            print(f"Error retrieving pins in channel '{channel.name}': {e}")
-            pinned_messages = []
-
-        # Locate the pinned message from the bot.
-        pinned_message = None
-        for msg in pinned_messages:
-            if msg.author.id == client.user.id:
-                pinned_message = msg
-                break
-
-        # clean up the pinned message content from markdown formatting
-        if pinned_message:
-            pinned_message.content = re.sub(
-                r"\*\*(.*?)\*\*", r"\1", pinned_message.content
-            )  # remove bold
-            pinned_message.content = re.sub(
-                r"\*(.*?)\*", r"\1", pinned_message.content
-            )  # remove italics
-            pinned_message.content = re.sub(
-                r"\*\*\*(.*?)\*\*\*", r"\1", pinned_message.content
-            )  # remove bold italics
-
-        # Write the pinned message content to a text file.
-        if pinned_message:
+        # The pinned message from the bot, as read by the snapshot.
+        pinned_message = entry.pin
+
+        # Write the pinned message content, cleaned up from markdown formatting, to a text file.
+        if not pinned_message:
+            print(f"No pinned message found for channel '{channel.name}'.")
+        elif not zip_path:
             pinned_file_path = os.path.join(channel_dir, "pinned.txt")
             try:
-                with open(pinned_file_path, "w", encoding="utf-8") as f:
-                    f.write(pinned_message.content)
+                write_text_atomic(
+                    pinned_file_path, strip_markdown(pinned_message.content)
+                )
                 print(f"Saved pinned message for channel '{channel.name}'.")
             except Exception as e:
                 print(f"Error saving pinned message for channel '{channel.name}': {e}")
-        else:
-            print(f"No pinned message found for channel '{channel.name}'.")
 
-        # Initialize a counter for naming downloaded slide files.
-        slide_counter = 1
+        # Collect the Google Slides links posted since the last export; the actual
+        # downloads happen afterwards, all in one pool.
+        manifest = await with_retries(
+            scan_history,
+            channel,
+            channel_dir,
+            label=f"Scanning channel '{channel.name}'",
+        )
+        manifests[entry.record_id] = manifest
+
+        # Queue every deck: new ones and those an interrupted run left without
+        # all of their artifacts, but also the exported ones, which are
+        # re-fetched with a conditional request so that edited decks are
+        # picked up (an unchanged deck costs a 304 and no rendering).
+        for deck in manifest.slides:
+            if zip_path:
+                complete = cache.artifacts(deck) is not None
+            else:
+                complete = manifest.is_complete(deck)
+            jobs.append(
+                SlideJob(
+                    channel.name,
+                    None if zip_path else channel_dir,
+                    deck["number"],
+                    deck["presentation_id"],
+                    deck,
+                    refresh=complete,
+                )
+            )
+
+    for (entry, _), e in await run_bounded(channels, discover):
+        print(f"Error retrieving history for channel '{entry.channel.name}': {e}")
 
-        # Iterate through all messages in the channel's history.
-        async for msg in channel.history(limit=None):
-            # Look for Google Slides URLs (assuming they begin with 'https://docs.google.com/presentation/d/').
-            slides_urls = re.findall(
-                r"(https://docs\.google\.com/presentation/d/[^/\s]+)", msg.content
+    refreshes = sum(job.refresh for job in jobs)
+    print(
+        f"Found {len(jobs) - refreshes} slide decks to export and {refreshes} "
+        f"to check for changes in {len(channels)} channels."
+    )
+    try:
+        await download_slides(jobs, cache)
+    finally:
+        for manifest in manifests.values():
+            manifest.save()
+
+    if zip_path:
+        bundle = []
+        for record_id, entry in snapshot.by_id.items():
+            details = entry.details
+            bundle.append(
+                {
+                    "name": entry.channel.name,
+                    "record_id": entry.record_id,
+                    "pinned": (
+                        None
+                        if details is None
+                        else {
+                            field: getattr(details, field) for field, _ in PINNED_FIELDS
+                        }
+                    ),
+                    "pinned_text": (
+                        strip_markdown(entry.pin.content) if entry.pin else None
+                    ),
+                    "slides": (
+                        manifests[record_id].slides if record_id in manifests else []
+                    ),
+                }
             )
-            if slides_urls:
-                for slides_url in slides_urls:
-                    # Extract the presentation ID from the URL.
-                    presentation_id_match = re.search(r"/d/([^/\s]+)", slides_url)
-                    if not presentation_id_match:
-                        print(f"Could not extract presentation ID from {slides_url}")
-                        continue
-                    presentation_id = presentation_id_match.group(1)
-
-                    # Construct the download URL for the slides (export as PDF)
-                    download_url = f"https://docs.google.com/presentation/d/{presentation_id}/export/pdf"
-
-                    async with aiohttp.ClientSession() as session:
-                        # Download the slides PDF.
-                        try:
-                            async with session.get(download_url) as resp:
-                                if resp.status == 200:
-                                    pdf_data = await resp.read()
-                                    pdf_file_path = os.path.join(
-                                        channel_dir, f"slides_{slide_counter}.pdf"
-                                    )
-                                    with open(pdf_file_path, "wb") as f:
-                                        f.write(pdf_data)
-                                    print(
-                                        f"Downloaded slides PDF for presentation {presentation_id} in channel '{channel.name}'."
-                                    )
-                                else:
-                                    print(
-                                        f"Failed to download slides PDF from {download_url}. Status code: {resp.status}"
-                                    )
-                                    continue  # Skip thumbnail extraction if download fails
-                        except Exception as e:
-                            print(
-                                f"Error downloading slides PDF from {download_url}: {e}"
-                            )
-                            continue
-
-                    # Extract thumbnail from the first page of the downloaded PDF.
-                    try:
-                        # Convert the first page of the PDF to an image.
-                        images = convert_from_bytes(pdf_data, first_page=1, last_page=1)
-                        if images:
-                            thumbnail_image = images[0]
-                            # Determine new height preserving aspect ratio for a new width of 720 pixels.
-                            orig_width, orig_height = thumbnail_image.size
-                            new_width = 720
-                            new_height = int(orig_height * (new_width / orig_width))
-                            # Use Image.Resampling.LANCZOS (available in recent Pillow versions)
-                            thumbnail_image = thumbnail_image.resize(
-                                (new_width, new_height), Image.Resampling.LANCZOS
-                            )
-
-                            thumbnail_file_path = os.path.join(
-                                channel_dir, f"thumbnail_{slide_counter}.png"
-                            )
-                            thumbnail_image.save(thumbnail_file_path, "PNG")
-                            print(
-                                f"Extracted and resized thumbnail for presentation {presentation_id} in channel '{channel.name}'."
-                            )
-                        else:
-                            print(
-                                f"Could not extract an image from PDF for presentation {presentation_id}."
-                            )
-                    except Exception as e:
-                        print(
-                            f"Error converting PDF to image for presentation {presentation_id}: {e}"
-                        )
-                    slide_counter += 1
+        try:
+            write_bundle(zip_path, bundle, cache)
+            print(f"Saved moodle bundle to '{zip_path}'.")
+        except Exception as e:
+            print(f"Error writing moodle bundle '{zip_path}': {e}")
+
+
+async def load_snapshot(guild, client, snapshot=None):
+    """Returns the given snapshot refreshed, or a newly loaded one."""
+    if snapshot is None:
+        return await GuildSnapshot.load(guild, client.user.id)
+    await snapshot.refresh()
+    return snapshot
+
+
+def strip_markdown(content):
+    content = re.sub(r"\*\*(.*?)\*\*", r"\1", content)  # remove bold
+    content = re.sub(r"\*(.*?)\*", r"\1", content)  # remove italics
+    content = re.sub(r"\*\*\*(.*?)\*\*\*", r"\1", content)  # remove bold italics
+    return content
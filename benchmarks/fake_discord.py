@@ -0,0 +1,282 @@
+"""
+In-process stand-ins for the parts of discord.py the actions use: a client,
+a guild with categories and text channels, messages, pins and paginated
+history. Every call that would hit the Discord API goes through FakeAPI, which
+counts it per route, optionally adds latency, enforces per-bucket rate limits
+(waiting like discord.py does after a 429) and injects server errors.
+"""
+
+import asyncio
+import itertools
+import random
+from collections import Counter
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import discord
+
+HISTORY_PAGE_SIZE = 100  # messages per GET /channels/{id}/messages request
+
+
+class FakeAPI:
+    def __init__(self, latency=0.0, rate_limit=None, error_rate=0.0, seed=0):
+        self.latency = latency
+        self.rate_limit = rate_limit  # (requests, per seconds) per bucket
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.calls = Counter()  # route -> requests
+        self.rate_limited = Counter()  # route -> 429 responses
+        self.rate_limit_wait = 0.0  # seconds spent waiting on 429s
+        self._windows = {}  # bucket -> [window start, requests in window]
+
+    def reset(self):
+        self.calls.clear()
+        self.rate_limited.clear()
+        self.rate_limit_wait = 0.0
+
+    async def request(self, route, bucket):
+        self.calls[route] += 1
+        if self.rate_limit is not None:
+            limit, per = self.rate_limit
+            loop = asyncio.get_running_loop()
+            window = self._windows.setdefault(bucket, [loop.time(), 0])
+            while True:
+                now = loop.time()
+                if now - window[0] >= per:
+                    window[0], window[1] = now, 0
+                if window[1] < limit:
+                    window[1] += 1
+                    break
+                wait = per - (now - window[0])
+                self.rate_limited[route] += 1
+                self.rate_limit_wait += wait
+                await asyncio.sleep(wait)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.error_rate and self.random.random() < self.error_rate:
+            raise discord.HTTPException(
+                SimpleNamespace(status=503, reason="Service Unavailable"),
+                f"injected error on {route}",
+            )
+
+
+class FakeGuild:
+    def __init__(self, api, guild_id=1):
+        self.api = api
+        self.id = guild_id
+        self.name = "Fake Guild"
+        self._ids = itertools.count(guild_id * 10_000_000 + 1)
+        self._clock = datetime(2025, 1, 6, 12, tzinfo=timezone.utc)
+        self.me = FakeUser(self, "presentation-bot", bot=True)
+        self.members = {}
+        self._categories = []
+        self._channels = []
+
+    def next_id(self):
+        return next(self._ids)
+
+    def now(self):
+        self._clock += timedelta(minutes=7)
+        return self._clock
+
+    @property
+    def categories(self):
+        return list(self._categories)
+
+    @property
+    def text_channels(self):
+        return list(self._channels)
+
+    @property
+    def channels(self):
+        return self._categories + self._channels
+
+    def get_member(self, user_id):
+        return self.members.get(user_id)
+
+    def get_channel(self, channel_id):
+        return next((c for c in self.channels if c.id == channel_id), None)
+
+    def add_member(self, name):
+        user = FakeUser(self, name)
+        self.members[user.id] = user
+        return user
+
+    async def create_category(self, name, **kwargs):
+        await self.api.request("POST /guilds/{guild_id}/channels", f"guild:{self.id}")
+        category = FakeCategory(self, name)
+        self._categories.append(category)
+        return category
+
+    async def create_text_channel(self, name, category=None, **kwargs):
+        await self.api.request("POST /guilds/{guild_id}/channels", f"guild:{self.id}")
+        channel = FakeTextChannel(self, name, category)
+        self._channels.append(channel)
+        return channel
+
+
+class FakeUser:
+    def __init__(self, guild, name, bot=False):
+        self.id = guild.next_id()
+        self.name = name
+        self.display_name = name
+        self.bot = bot
+
+
+class FakeCategory:
+    def __init__(self, guild, name):
+        self.guild = guild
+        self.id = guild.next_id()
+        self.name = name
+        self.category_id = None
+
+    @property
+    def channels(self):
+        return [c for c in self.guild.text_channels if c.category_id == self.id]
+
+    text_channels = channels
+
+    async def delete(self, **kwargs):
+        await self.guild.api.request(
+            "DELETE /channels/{channel_id}", f"channel:{self.id}"
+        )
+        self.guild._categories.remove(self)
+
+
+class FakeTextChannel:
+    def __init__(self, guild, name, category=None):
+        self.guild = guild
+        self.id = guild.next_id()
+        self.name = name
+        self.category = category
+        self.messages = []  # oldest first
+
+    @property
+    def category_id(self):
+        return self.category.id if self.category is not None else None
+
+    def _bucket(self, suffix=""):
+        return f"channel:{self.id}{suffix}"
+
+    def post(self, author, content):
+        """Adds a message without an API call (for seeding a guild)."""
+        message = FakeMessage(self, author, content)
+        self.messages.append(message)
+        return message
+
+    async def send(self, content=None, **kwargs):
+        await self.guild.api.request(
+            "POST /channels/{channel_id}/messages", self._bucket(":messages")
+        )
+        return self.post(self.guild.me, content)
+
+    async def pins(self, **kwargs):
+        await self.guild.api.request(
+            "GET /channels/{channel_id}/pins", self._bucket(":pins")
+        )
+        return [m for m in reversed(self.messages) if m.pinned]
+
+    async def history(self, limit=100, after=None, oldest_first=None, **kwargs):
+        if oldest_first is None:
+            oldest_first = after is not None
+        after_id = getattr(after, "id", after) or 0
+        messages = [m for m in self.messages if m.id > after_id]
+        if not oldest_first:
+            messages.reverse()
+        if limit is not None:
+            messages = messages[:limit]
+        for i in range(0, max(len(messages), 1), HISTORY_PAGE_SIZE):
+            await self.guild.api.request(
+                "GET /channels/{channel_id}/messages", self._bucket(":history")
+            )
+            for message in messages[i : i + HISTORY_PAGE_SIZE]:
+                yield message
+
+    def get_partial_message(self, message_id):
+        return FakePartialMessage(self, message_id)
+
+    async def delete(self, **kwargs):
+        await self.guild.api.request("DELETE /channels/{channel_id}", self._bucket())
+        self.guild._channels.remove(self)
+
+    async def edit(self, **kwargs):
+        await self.guild.api.request("PATCH /channels/{channel_id}", self._bucket())
+        if "category" in kwargs:
+            self.category = kwargs["category"]
+        if "name" in kwargs:
+            self.name = kwargs["name"]
+        return self
+
+
+class FakeMessage:
+    def __init__(self, channel, author, content):
+        self.channel = channel
+        self.id = channel.guild.next_id()
+        self.author = author
+        self.content = content
+        self.created_at = channel.guild.now()
+        self.pinned = False
+
+    async def pin(self, **kwargs):
+        await self.channel.guild.api.request(
+            "PUT /channels/{channel_id}/pins/{message_id}",
+            self.channel._bucket(":pins"),
+        )
+        self.pinned = True
+
+    async def edit(self, content=None, **kwargs):
+        await self.channel.guild.api.request(
+            "PATCH /channels/{channel_id}/messages/{message_id}",
+            self.channel._bucket(":messages"),
+        )
+        self.content = content
+        return self
+
+    async def delete(self, **kwargs):
+        await self.channel.guild.api.request(
+            "DELETE /channels/{channel_id}/messages/{message_id}",
+            self.channel._bucket(":messages"),
+        )
+        self.channel.messages.remove(self)
+
+
+class FakePartialMessage:
+    """A message known only by id, as returned by get_partial_message."""
+
+    def __init__(self, channel, message_id):
+        self.channel = channel
+        self.id = message_id
+
+    async def _request(self, route):
+        await self.channel.guild.api.request(route, self.channel._bucket(":messages"))
+        for message in self.channel.messages:
+            if message.id == self.id:
+                return message
+        raise discord.NotFound(
+            SimpleNamespace(status=404, reason="Not Found"), "Unknown Message"
+        )
+
+    async def edit(self, content=None, **kwargs):
+        message = await self._request(
+            "PATCH /channels/{channel_id}/messages/{message_id}"
+        )
+        message.content = content
+        return message
+
+    async def delete(self, **kwargs):
+        message = await self._request(
+            "DELETE /channels/{channel_id}/messages/{message_id}"
+        )
+        self.channel.messages.remove(message)
+
+
+class FakeClient:
+    def __init__(self, guild, *more_guilds):
+        self.guild = guild
+        self.user = guild.me
+        self.guilds = [guild, *more_guilds]
+        for other in more_guilds:
+            other.me = guild.me  # One bot account is a member of every guild.
+
+    def get_guild(self, guild_id):
+        return next((g for g in self.guilds if g.id == guild_id), None)
@@ -0,0 +1,274 @@
+"""
+Offline benchmarks for the bot's actions against a fake guild (see
+fake_discord.py). For each guild size the actions are run in a realistic
+sequence (first sync, re-sync, partial update, stats, moodle export, removal)
+and the wall time, number of API calls and rate-limit waits are reported.
+
+Usage (from the repository root):
+
+    python -m benchmarks.run [--sizes 10 100 1000] [--latency 0.01]
+                             [--rate-limit 5/1] [--error-rate 0.0]
+                             [--messages 20] [--json results.json]
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from datetime import date, timedelta
+
+from aiohttp import web
+
+GUILD_ID = 1
+SLIDES_PORT = 8765
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 100, 1000])
+    parser.add_argument(
+        "--latency", type=float, default=0.005, help="seconds added to every call"
+    )
+    parser.add_argument(
+        "--rate-limit",
+        default=None,
+        help='per-bucket limit as "requests/seconds", e.g. "5/1"',
+    )
+    parser.add_argument(
+        "--error-rate", type=float, default=0.0, help="fraction of calls failing 503"
+    )
+    parser.add_argument(
+        "--messages", type=int, default=20, help="chat messages seeded per channel"
+    )
+    parser.add_argument("--skip-moodle", action="store_true")
+    parser.add_argument("--json", help="also write the results to this file")
+    parser.add_argument(
+        "--verbose", action="store_true", help="show the actions' own output"
+    )
+    return parser.parse_args()
+
+
+def write_schedule(path, size, revision=0):
+    """Writes a synthetic schedule; with revision > 0 every 10th title changes."""
+    start = date(2025, 1, 6)
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        f.write(
+            "Date,ID,Discord Channel Name,Paper Title,Paper Link,Presenters,Topic\n"
+        )
+        for i in range(size):
+            day = start + timedelta(days=i // 3)
+            title = f"Paper {i}"
+            if revision and i % 10 == 0:
+                title += f" (rev {revision})"
+            f.write(
+                f'"{day.strftime("%A, %B %d, %Y")}",{i + 1},paper-{i + 1},'
+                f"{title},https://example.org/{i},Presenter {i % 17},Topic {i % 5}\n"
+            )
+
+
+def seed_history(guild, messages_per_channel, members):
+    """Adds chat messages, one of them a Google Slides link, to every channel."""
+    for n, channel in enumerate(guild.text_channels):
+        for i in range(messages_per_channel):
+            author = members[(n + i) % len(members)]
+            content = f"message {i}"
+            if i == 0:
+                content = (
+                    "slides: https://docs.google.com/presentation/d/"
+                    f"deck{n % 50}/edit"
+                )
+            channel.post(author, content)
+
+
+async def start_slides_server(pdf_path):
+    async def export(request):
+        return web.FileResponse(pdf_path)
+
+    app = web.Application()
+    app.router.add_get("/presentation/d/{presentation_id}/export/pdf", export)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", SLIDES_PORT).start()
+    return runner
+
+
+def clean_outputs(workdir):
+    for name in os.listdir(workdir):
+        path = os.path.join(workdir, name)
+        if name == "deck.pdf":
+            continue
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        else:
+            os.remove(path)
+
+
+async def run_size(size, args, actions, fake, workdir):
+    csv_path = os.environ["CSV_FILE"]
+    clean_outputs(workdir)
+    write_schedule(csv_path, size)
+
+    api = fake.FakeAPI(
+        latency=args.latency, rate_limit=args.rate_limit, error_rate=args.error_rate
+    )
+    guild = fake.FakeGuild(api, GUILD_ID)
+    client = fake.FakeClient(guild)
+    members = [guild.add_member(f"member{i}") for i in range(max(size // 2, 5))]
+    results = []
+
+    async def measure(scenario, coro):
+        api.reset()
+        output = io.StringIO()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(sys.stdout if args.verbose else output):
+            await coro
+        elapsed = time.perf_counter() - start
+        results.append(
+            {
+                "size": size,
+                "scenario": scenario,
+                "wall_time": round(elapsed, 4),
+                "api_calls": sum(api.calls.values()),
+                "rate_limited": sum(api.rate_limited.values()),
+                "rate_limit_wait": round(api.rate_limit_wait, 4),
+                "calls": dict(api.calls),
+            }
+        )
+
+    await measure("add (empty guild)", actions.process_csv_add(client))
+    await measure("add (in sync)", actions.process_csv_add(client))
+    os.remove(actions.STATE_FILE)
+    await measure("add (in sync, no cache)", actions.process_csv_add(client))
+    write_schedule(csv_path, size, revision=1)
+    await measure("add (10% changed)", actions.process_csv_add(client))
+
+    seed_history(guild, args.messages, members)
+    await measure("stats (full)", actions.process_stats(client))
+    for channel in guild.text_channels:
+        channel.post(members[0], "one more thing")
+    await measure("stats (incremental)", actions.process_stats(client))
+
+    if not args.skip_moodle:
+        await measure("moodle (full)", actions.process_moodle(client))
+        await measure("moodle (incremental)", actions.process_moodle(client))
+        await measure(
+            "moodle --zip",
+            actions.process_moodle(
+                client, moodle_dir="moodle_zip_state", zip_path="moodle.zip"
+            ),
+        )
+
+        # As in --serve: both jobs read pins from one guild snapshot.
+        snapshot = actions.GuildSnapshot(guild, client.user.id)
+
+        async def stats_and_moodle():
+            await actions.process_stats(client, snapshot=snapshot)
+            await actions.process_moodle(client, snapshot=snapshot)
+
+        await measure("stats + moodle (shared)", stats_and_moodle())
+
+    # Three more guilds, each with its own schedule, reconciled in one run;
+    # their routes are rate-limited separately, so this should take about as
+    # long as a single "add (empty guild)".
+    from config import default_state_file
+    from guilds import GuildConfig, run_guilds
+
+    others = [fake.FakeGuild(api, GUILD_ID + n) for n in (1, 2, 3)]
+    configs = []
+    for other in others:
+        path = os.path.join(workdir, f"schedule{other.id}.csv")
+        write_schedule(path, size)
+        configs.append(
+            GuildConfig(
+                f"guild{other.id}",
+                other.id,
+                path,
+                default_state_file(path, other.id),
+            )
+        )
+    await measure(
+        "add (3 guilds at once)",
+        run_guilds(fake.FakeClient(*others), configs, "add"),
+    )
+
+    await measure("remove --archive", actions.process_csv_remove(client, archive=True))
+    # Archiving leaves the month categories empty; recreate the channels so
+    # the delete path is measured on the same guild.
+    with contextlib.redirect_stdout(io.StringIO()):
+        await actions.process_csv_add(client)
+    await measure("remove", actions.process_csv_remove(client))
+    return results
+
+
+def print_results(results):
+    header = f"{'size':>6}  {'scenario':<26}{'wall (s)':>10}{'api calls':>11}{'429s':>7}{'429 wait (s)':>14}"
+    print(header)
+    print("-" * len(header))
+    for r in results:
+        print(
+            f"{r['size']:>6}  {r['scenario']:<26}{r['wall_time']:>10.3f}"
+            f"{r['api_calls']:>11}{r['rate_limited']:>7}{r['rate_limit_wait']:>14.2f}"
+        )
+
+
+async def run_all(args, actions, fake, workdir):
+    pdf_path = os.path.join(workdir, "deck.pdf")
+    runner = await start_slides_server(pdf_path)
+    try:
+        results = []
+        for size in args.sizes:
+            results.extend(await run_size(size, args, actions, fake, workdir))
+        return results
+    finally:
+        await runner.cleanup()
+
+
+def main():
+    args = parse_args()
+    if args.rate_limit:
+        requests, per = args.rate_limit.split("/")
+        args.rate_limit = (int(requests), float(per))
+
+    workdir = tempfile.mkdtemp(prefix="bot-bench-")
+    # The bot's configuration is read from the environment at import time, so
+    # point it at the synthetic schedule and the local slides server first.
+    os.environ.update(
+        DISCORD_TOKEN="benchmark",
+        GUILD_ID=str(GUILD_ID),
+        CSV_FILE=os.path.join(workdir, "schedule.csv"),
+        SLIDES_EXPORT_URL=f"http://127.0.0.1:{SLIDES_PORT}/presentation/d/{{presentation_id}}/export/pdf",
+        RETRY_BASE_DELAY=os.environ.get("RETRY_BASE_DELAY", "0.05"),
+    )
+    output_path = os.path.abspath(args.json) if args.json else None
+    # Outputs (stats.csv, moodle/, caches) land in the scratch directory.
+    sys.path.insert(0, REPO_ROOT)
+    os.chdir(workdir)
+
+    from PIL import Image
+
+    Image.new("RGB", (1600, 900), "white").save("deck.pdf", "PDF")
+
+    import actions
+    from benchmarks import fake_discord
+
+    try:
+        results = asyncio.run(run_all(args, actions, fake_discord, workdir))
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_results(results)
+    if output_path:
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved results to '{output_path}'.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import asyncio
+import random
+
+import aiohttp
+import discord
+
+from config import CONCURRENCY, RETRY_ATTEMPTS, RETRY_BASE_DELAY
+from metrics import metrics
+
+
+def is_retryable(exc):
+    """
+    Returns True for errors that are worth retrying: Discord server errors,
+    rate limits that discord.py gave up waiting on, and network failures.
+    Client errors such as Forbidden or NotFound will not go away on retry.
+    """
+    if isinstance(exc, discord.RateLimited):
+        return True
+    if isinstance(exc, discord.HTTPException):
+        return exc.status == 429 or exc.status >= 500
+    if isinstance(exc, aiohttp.ClientResponseError):
+        return exc.status == 429 or exc.status >= 500
+    return isinstance(exc, (aiohttp.ClientError, asyncio.TimeoutError, ConnectionError))
+
+
+async def with_retries(func, *args, attempts=None, base_delay=None, label="", **kwargs):
+    """
+    Awaits func(*args, **kwargs), retrying retryable failures with exponential
+    backoff and jitter. The last exception is re-raised once all attempts fail.
+    """
+    attempts = RETRY_ATTEMPTS if attempts is None else attempts
+    base_delay = RETRY_BASE_DELAY if base_delay is None else base_delay
+    label = label or getattr(func, "__qualname__", repr(func))
+
+    for attempt in range(1, attempts + 1):
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            if attempt == attempts or not is_retryable(e):
+                raise
+            delay = getattr(e, "retry_after", None) or base_delay * 2 ** (attempt - 1)
+            delay += random.uniform(0, base_delay)
+            print(
+                f"{label} failed ({e}); retrying in {delay:.1f}s "
+                f"(attempt {attempt + 1}/{attempts})."
+            )
+            with metrics.timer("(retry backoff)"):
+                await asyncio.sleep(delay)
+
+
+async def run_bounded(items, worker, limit=None):
+    """
+    Runs `await worker(item)` for every item with at most `limit` workers in
+    flight. Returns a list of (item, exception) pairs for the items whose
+    worker raised, so callers can report failures after the batch finishes.
+    """
+    limit = CONCURRENCY if limit is None else limit
+    semaphore = asyncio.Semaphore(max(1, limit))
+    failures = []
+
+    async def run_one(item):
+        async with semaphore:
+            try:
+                await worker(item)
+            except Exception as e:
+                failures.append((item, e))
+
+    await asyncio.gather(*(run_one(item) for item in items))
+    return failures
@@ -4,10 +4,96 @@ from dotenv import load_dotenv
 
 load_dotenv()  # Load variables from the .env file
 
+
+def default_state_file(csv_file, guild_id=None):
+    """
+    The state cache next to a schedule; with a guild id (see guilds.py) it is
+    per guild, since several guilds may share one schedule.
+    """
+    if not csv_file:
+        return None
+    stem = os.path.splitext(csv_file)[0]
+    return f"{stem}.{guild_id}.state.json" if guild_id else f"{stem}.state.json"
+
+
 TOKEN = os.getenv("DISCORD_TOKEN")
-GUILD_ID = int(os.getenv("GUILD_ID"))  # type: ignore
+GUILD_ID = int(os.getenv("GUILD_ID")) if os.getenv("GUILD_ID") else None
 CSV_FILE = os.getenv("CSV_FILE")  # e.g., "data.csv"
+# Local cache of channel ids and pinned-message hashes, kept next to the CSV.
+STATE_FILE = os.getenv("STATE_FILE") or default_state_file(CSV_FILE)
+# Optional JSON file listing several guilds and their schedules (see guilds.py);
+# --add and --remove then handle all of them instead of GUILD_ID and CSV_FILE.
+GUILDS_FILE = os.getenv("GUILDS_FILE")
+
+# Per-channel history cursors and participants for incremental --stats runs.
+STATS_STATE_FILE = os.getenv("STATS_STATE_FILE", "stats_state.json")
+# Number of most recent sessions used for the rolling attendance rate.
+STATS_ROLLING_WINDOW = int(os.getenv("STATS_ROLLING_WINDOW", "4"))
+# Format of the long (one row per user and session) participation table:
+# parquet, arrow, csv or none. Parquet and Arrow need pyarrow (the "stats"
+# extra); unset means parquet when pyarrow is installed and csv otherwise.
+STATS_LONG_FORMAT = os.getenv("STATS_LONG_FORMAT", "").lower() or None
+
+# Maximum number of channels worked on at the same time. Per-channel routes
+# (send, pin, pins) have their own rate-limit bucket, so they can overlap.
+CONCURRENCY = int(os.getenv("CONCURRENCY", "5"))
+# Creating channels and categories goes through a single guild-wide bucket, so
+# firing many of those at once only produces 429s.
+GUILD_ROUTE_CONCURRENCY = int(os.getenv("GUILD_ROUTE_CONCURRENCY", "1"))
+# Slide exports for --moodle: parallel downloads over one pooled HTTP session
+# and the per-request timeout in seconds.
+DOWNLOAD_CONCURRENCY = int(os.getenv("DOWNLOAD_CONCURRENCY", "8"))
+DOWNLOAD_TIMEOUT = float(os.getenv("DOWNLOAD_TIMEOUT", "120"))
+# Slide PDFs are streamed to disk in chunks of this many bytes; exports larger
+# than MAX_SLIDES_SIZE megabytes are aborted.
+DOWNLOAD_CHUNK_SIZE = int(os.getenv("DOWNLOAD_CHUNK_SIZE", str(64 * 1024)))
+MAX_SLIDES_SIZE = int(os.getenv("MAX_SLIDES_SIZE", "200"))
+# Where a presentation is exported from; "{presentation_id}" is substituted.
+SLIDES_EXPORT_URL = os.getenv(
+    "SLIDES_EXPORT_URL",
+    "https://docs.google.com/presentation/d/{presentation_id}/export/pdf",
+)
+# Content-addressed cache of exported slide PDFs and thumbnails.
+SLIDES_CACHE_DIR = os.getenv("SLIDES_CACHE_DIR", "slides_cache")
+# Optional zip file --moodle writes its whole export into (with an index.json)
+# instead of the per-channel folders.
+MOODLE_ZIP = os.getenv("MOODLE_ZIP")
+# Thumbnails are rendered in a process pool: number of worker processes,
+# target width in pixels and image format (png, webp or jpeg).
+THUMBNAIL_WORKERS = int(os.getenv("THUMBNAIL_WORKERS", str(os.cpu_count() or 1)))
+THUMBNAIL_WIDTH = int(os.getenv("THUMBNAIL_WIDTH", "720"))
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", "png")
+# Retry policy for failed API calls (exponential backoff, in seconds).
+RETRY_ATTEMPTS = int(os.getenv("RETRY_ATTEMPTS", "4"))
+RETRY_BASE_DELAY = float(os.getenv("RETRY_BASE_DELAY", "1.0"))
+# --serve: how often (seconds) CSV_FILE is checked for changes, and how often
+# the stats and moodle exports run (0 disables a scheduled job).
+WATCH_INTERVAL = float(os.getenv("WATCH_INTERVAL", "30"))
+STATS_INTERVAL = float(os.getenv("STATS_INTERVAL", str(24 * 60 * 60)))
+MOODLE_INTERVAL = float(os.getenv("MOODLE_INTERVAL", str(24 * 60 * 60)))
+# --remove --archive moves channels into this category (then "... 2", "... 3"
+# once a category is full) instead of deleting them.
+ARCHIVE_CATEGORY = os.getenv("ARCHIVE_CATEGORY", "Archived Presentations")
+# Optional file the run's metrics (API calls, latencies, rate-limit waits) are
+# written to: Prometheus text format if it ends in ".prom", JSON otherwise.
+METRICS_FILE = os.getenv("METRICS_FILE")
+
+# Environment variable behind each setting that has no default.
+REQUIRED_SETTINGS = {
+    "TOKEN": "DISCORD_TOKEN",
+    "GUILD_ID": "GUILD_ID",
+    "CSV_FILE": "CSV_FILE",
+}
+
 
-assert TOKEN is not None, "DISCORD_TOKEN environment variable is required."
-assert GUILD_ID is not None, "GUILD_ID environment variable is required."
-assert CSV_FILE is not None, "CSV_FILE environment variable is required."
+def missing_settings(names):
+    """
+    Returns an error message for each of the named settings that is not set.
+    Checked by main.py for the command being run rather than at import time,
+    so e.g. --help and --stats work without a CSV_FILE.
+    """
+    return [
+        f"{REQUIRED_SETTINGS[name]} environment variable is required."
+        for name in names
+        if globals()[name] is None
+    ]
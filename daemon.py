@@ -0,0 +1,190 @@
+import asyncio
+import os
+
+from actions import process_csv_add, process_moodle, process_stats
+from config import (
+    CSV_FILE,
+    GUILD_ID,
+    METRICS_FILE,
+    MOODLE_INTERVAL,
+    STATS_INTERVAL,
+    WATCH_INTERVAL,
+)
+from metrics import metrics
+from planner import load_desired_state
+from snapshot import GuildSnapshot
+
+
+class JobQueue:
+    """
+    Runs jobs one at a time in submission order, so a reconcile, a stats scan
+    and a moodle export never compete for the same rate limits. A job that is
+    already waiting to run is not queued a second time.
+    """
+
+    def __init__(self):
+        self.queue = asyncio.Queue()
+        self.waiting = set()  # names of queued jobs that have not started
+
+    def submit(self, name, job):
+        """Queues `await job()` under name unless a job of that name is waiting."""
+        if name in self.waiting:
+            return False
+        self.waiting.add(name)
+        self.queue.put_nowait((name, job))
+        return True
+
+    async def run(self):
+        while True:
+            name, job = await self.queue.get()
+            self.waiting.discard(name)
+            print(f"Running job '{name}'.")
+            try:
+                with metrics.action(name):
+                    await job()
+            except Exception as e:
+                print(f"Error in job '{name}': {e}")
+            finally:
+                self.queue.task_done()
+            # Keep the metrics file current so it can be scraped while serving.
+            if METRICS_FILE:
+                try:
+                    metrics.save(METRICS_FILE)
+                except Exception as e:
+                    print(f"Error saving metrics to '{METRICS_FILE}': {e}")
+
+
+class CsvWatcher:
+    """
+    Polls the CSV file every WATCH_INTERVAL seconds and queues a reconcile of
+    the rows that were added or changed since the last read. The first read
+    reconciles the whole file. Rows whose changes failed to apply stay pending
+    and are retried on the next check.
+    """
+
+    def __init__(self, client, jobs, snapshot=None, csv_file=CSV_FILE):
+        self.client = client
+        self.jobs = jobs
+        self.snapshot = snapshot
+        self.csv_file = csv_file
+        self.signature = None  # (mtime, size) when last read, or "missing"
+        self.rows = None  # record id -> DesiredChannel as of the last read
+        self.pending = set()  # record ids waiting to be reconciled
+        self.full = True  # no reconcile has completed yet
+
+    def check(self):
+        try:
+            stat = os.stat(self.csv_file)
+        except FileNotFoundError:
+            if self.signature != "missing":
+                print(f"CSV file '{self.csv_file}' not found.")
+            self.signature = "missing"
+            return
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if signature != self.signature:
+            self.signature = signature
+            self.read()
+        if self.full or self.pending:
+            self.jobs.submit("add", self.reconcile)
+
+    def read(self):
+        try:
+            _, desired = load_desired_state(self.csv_file)
+        except Exception as e:
+            print(f"Error reading CSV file '{self.csv_file}': {e}")
+            return
+        rows = {item.record_id: item for item in desired}
+        if self.rows is not None:
+            changed = {
+                record_id
+                for record_id, item in rows.items()
+                if self.rows.get(record_id) != item
+            }
+            removed = sorted(self.rows.keys() - rows.keys())
+            if changed:
+                print(f"CSV file changed: {len(changed)} new or updated rows.")
+                self.pending |= changed
+            if removed:
+                print(
+                    f"Rows removed from the CSV file: {', '.join(removed)}. "
+                    "Their channels are left in place."
+                )
+        self.rows = rows
+        self.pending &= rows.keys()
+
+    async def reconcile(self):
+        record_ids = None if self.full else set(self.pending)
+        self.pending.clear()
+        failed = await process_csv_add(
+            self.client, record_ids=record_ids, snapshot=self.snapshot
+        )
+        attempted = set(self.rows or ()) if record_ids is None else record_ids
+        if failed is None:
+            # Nothing was planned (e.g. the guild is unavailable); try again.
+            self.pending |= attempted
+            return
+        self.full = False
+
+        # Changes skipped because their category failed are reported too.
+        retry = {c.record_id for c in failed if c.record_id is not None}
+        if retry:
+            print(f"{len(retry)} rows failed and will be retried.")
+            self.pending |= retry
+
+    async def run(self):
+        while True:
+            self.check()
+            await asyncio.sleep(WATCH_INTERVAL)
+
+
+async def run_every(interval, callback):
+    while True:
+        await asyncio.sleep(interval)
+        callback()
+
+
+async def serve(client):
+    """
+    Keeps the connection open and runs every job through one JobQueue: a
+    reconcile whenever the CSV file changes (see CsvWatcher), the stats export
+    every STATS_INTERVAL seconds and the moodle export every MOODLE_INTERVAL
+    seconds. Runs until the process is stopped. The jobs share one
+    GuildSnapshot, so pins are only re-read for channels that changed.
+    """
+    guild = client.get_guild(GUILD_ID)
+    snapshot = GuildSnapshot(guild, client.user.id) if guild is not None else None
+    jobs = JobQueue()
+    watcher = CsvWatcher(client, jobs, snapshot)
+    tasks = [asyncio.create_task(jobs.run()), asyncio.create_task(watcher.run())]
+    if STATS_INTERVAL > 0:
+        tasks.append(
+            asyncio.create_task(
+                run_every(
+                    STATS_INTERVAL,
+                    lambda: jobs.submit(
+                        "stats", lambda: process_stats(client, snapshot=snapshot)
+                    ),
+                )
+            )
+        )
+    if MOODLE_INTERVAL > 0:
+        tasks.append(
+            asyncio.create_task(
+                run_every(
+                    MOODLE_INTERVAL,
+                    lambda: jobs.submit(
+                        "moodle", lambda: process_moodle(client, snapshot=snapshot)
+                    ),
+                )
+            )
+        )
+    print(
+        f"Serving: watching '{CSV_FILE}' every {WATCH_INTERVAL:g}s, "
+        f"stats every {STATS_INTERVAL:g}s, moodle every {MOODLE_INTERVAL:g}s "
+        "(0 = off)."
+    )
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
@@ -0,0 +1,148 @@
+import asyncio
+import json
+import os
+import time
+from dataclasses import dataclass
+
+from config import default_state_file
+from metrics import metrics
+from schedule import ValidationError
+
+
+@dataclass(slots=True, frozen=True)
+class GuildConfig:
+    """One guild and the schedule it is reconciled against."""
+
+    name: str  # label for output and metrics, e.g. "ml-reading-group"
+    guild_id: int
+    csv_file: str
+    state_file: str
+
+
+class GuildsFileError(ValidationError):
+    """Raised with every problem found in a guilds file, before logging in."""
+
+
+def load_guilds(path):
+    """
+    Reads a guilds file (GUILDS_FILE), a JSON list of objects such as
+
+        [{"name": "ml", "guild_id": 123, "csv_file": "ml.csv"}, ...]
+
+    with an optional "state_file" per guild (default: "{csv}.{guild_id}.state.json"
+    next to its CSV). Relative paths are taken from the guilds file's directory.
+    Guilds may share a schedule but not a state file, since each run rewrites
+    the file with its own guild's channels only.
+    Raises GuildsFileError listing every problem.
+    """
+    with open(path, encoding="utf-8") as f:
+        try:
+            items = json.load(f)
+        except ValueError as e:
+            raise GuildsFileError(path, [f"Not valid JSON: {e}."])
+    if not isinstance(items, list) or not items:
+        raise GuildsFileError(path, ["Expected a non-empty list of guilds."])
+
+    base = os.path.dirname(os.path.abspath(path))
+    guilds = []
+    errors = []
+    names = set()
+    guild_ids = set()
+    state_files = {}  # state file -> name of the guild using it
+    for number, item in enumerate(items, start=1):
+        if not isinstance(item, dict):
+            errors.append(f"Entry {number}: expected an object.")
+            continue
+        try:
+            guild_id = int(item.get("guild_id"))
+        except (TypeError, ValueError):
+            errors.append(f"Entry {number}: 'guild_id' must be a number.")
+            continue
+        name = str(item.get("name") or guild_id)
+        csv_file = item.get("csv_file")
+        if not csv_file:
+            errors.append(f"Entry {number} ({name}): 'csv_file' is required.")
+            continue
+        if name in names:
+            errors.append(f"Entry {number}: name '{name}' is already used.")
+        if guild_id in guild_ids:
+            # Two schedules reconciled into one guild would undo each other.
+            errors.append(f"Entry {number}: guild {guild_id} is already listed.")
+        names.add(name)
+        guild_ids.add(guild_id)
+
+        csv_file = os.path.join(base, csv_file)
+        state_file = item.get("state_file")
+        state_file = os.path.normpath(
+            os.path.join(base, state_file)
+            if state_file
+            else default_state_file(csv_file, guild_id)
+        )
+        other = state_files.setdefault(state_file, name)
+        if other != name:
+            errors.append(
+                f"Entry {number} ({name}): state file '{state_file}' is already "
+                f"used by '{other}'."
+            )
+        guilds.append(GuildConfig(name, guild_id, csv_file, state_file))
+
+    if errors:
+        raise GuildsFileError(path, errors)
+    return guilds
+
+
+async def run_guilds(client, guilds, command, **options):
+    """
+    Runs "add" or "remove" for every guild at once over the one client. Each
+    guild gets its own worker pool and guild-route limit (see
+    planner.apply_changes), and Discord rate-limits routes per guild, so a
+    large or throttled guild does not hold the others back. Calls are
+    recorded under the action "{command}:{name}". Prints a combined summary.
+    """
+    from actions import process_csv_add, process_csv_remove
+
+    process = process_csv_add if command == "add" else process_csv_remove
+    results = {}
+
+    async def run_guild(guild):
+        start = time.perf_counter()
+        try:
+            with metrics.action(f"{command}:{guild.name}"):
+                failed = await process(
+                    client,
+                    guild_id=guild.guild_id,
+                    csv_file=guild.csv_file,
+                    state_file=guild.state_file,
+                    **options,
+                )
+            if failed is None:
+                result = "not run"
+            elif failed:
+                result = f"{len(failed)} failed"
+            else:
+                result = "ok"
+        except Exception as e:
+            print(f"Error in guild '{guild.name}': {e}")
+            result = "error"
+        results[guild.name] = (result, time.perf_counter() - start)
+
+    await asyncio.gather(*(run_guild(guild) for guild in guilds))
+    print_guild_summary(guilds, command, results)
+
+
+def print_guild_summary(guilds, command, results):
+    width = max(len("guild"), *(len(guild.name) for guild in guilds)) + 2
+    header = (
+        f"{'guild':<{width}}{'guild id':>20}  {'result':<12}"
+        f"{'time s':>8}{'api calls':>11}{'429s':>6}"
+    )
+    print("\nGuilds:")
+    print(header)
+    print("-" * len(header))
+    for guild in guilds:
+        result, seconds = results.get(guild.name, ("not run", 0.0))
+        calls, rate_limited = metrics.totals(f"{command}:{guild.name}")
+        print(
+            f"{guild.name:<{width}}{guild.guild_id:>20}  {result:<12}"
+            f"{seconds:>8.2f}{calls:>11}{rate_limited:>6}"
+        )
@@ -1,37 +1,278 @@
+import argparse
+import os
 import sys
 
-import discord
+# The old single-flag invocations ("main.py --add --dry-run") keep working.
+LEGACY_FLAGS = {
+    "--add": "add",
+    "--remove": "remove",
+    "--stats": "stats",
+    "--moodle": "moodle",
+    "--serve": "serve",
+}
 
-from actions import process_csv_add, process_csv_remove, process_moodle, process_stats
-from config import TOKEN
+# Settings each subcommand cannot run without (see config.missing_settings).
+REQUIRED = {
+    "add": ("TOKEN", "GUILD_ID", "CSV_FILE"),
+    "remove": ("TOKEN", "GUILD_ID", "CSV_FILE"),
+    "stats": ("TOKEN", "GUILD_ID"),
+    "moodle": ("TOKEN", "GUILD_ID"),
+    "serve": ("TOKEN", "GUILD_ID", "CSV_FILE"),
+}
+# Commands that can run over every guild of a guilds file (see guilds.py).
+MULTI_GUILD_COMMANDS = ("add", "remove")
 
-# Check command-line arguments for operation mode.
-if len(sys.argv) < 2 or sys.argv[1] not in ["--add", "--remove", "--stats", "--moodle"]:
-    print("Usage: python3 main.py --add, --remove, --stats, or --moodle")
+
+def build_parser():
+    parser = argparse.ArgumentParser(
+        prog="main.py",
+        description="Manage presentation channels on a Discord server.",
+    )
+    parser.add_argument(
+        "--metrics-file",
+        help="write the run's metrics here (.prom for Prometheus, else JSON)",
+    )
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    def add_concurrency(subparser):
+        subparser.add_argument(
+            "--concurrency",
+            type=int,
+            help="channels processed at the same time (default: CONCURRENCY or 5)",
+        )
+
+    def add_csv(subparser):
+        subparser.add_argument(
+            "--csv", help="schedule file to use instead of CSV_FILE (.csv or .xlsx)"
+        )
+
+    def add_guilds(subparser):
+        subparser.add_argument(
+            "--guilds",
+            help="JSON file of guilds and schedules to process together "
+            "(default: GUILDS_FILE)",
+        )
+
+    add = subparsers.add_parser("add", help="create or update channels from the CSV")
+    add_csv(add)
+    add_guilds(add)
+    add_concurrency(add)
+    add.add_argument(
+        "--dry-run", action="store_true", help="print the planned changes only"
+    )
+    add.add_argument(
+        "--rebuild-cache",
+        action="store_true",
+        help="ignore the local state cache and re-read every pin",
+    )
+    add.add_argument("--state-file", help="state cache to use instead of STATE_FILE")
+
+    remove = subparsers.add_parser("remove", help="remove the CSV's channels")
+    add_csv(remove)
+    add_guilds(remove)
+    add_concurrency(remove)
+    remove.add_argument(
+        "--dry-run", action="store_true", help="print the planned changes only"
+    )
+    remove.add_argument(
+        "--archive",
+        action="store_true",
+        help="move the channels into the archive category instead of deleting them",
+    )
+
+    stats = subparsers.add_parser("stats", help="export attendance statistics")
+    add_concurrency(stats)
+    stats.add_argument(
+        "--output-prefix",
+        default="stats",
+        help='prefix of the files written (default "stats": stats.csv, ...)',
+    )
+    stats.add_argument(
+        "--state-file", help="history cursors to use instead of STATS_STATE_FILE"
+    )
+    stats.add_argument(
+        "--long-format",
+        choices=("parquet", "arrow", "csv", "none"),
+        help=(
+            "format of the long participation table (default: STATS_LONG_FORMAT, "
+            "else parquet if pyarrow is installed, otherwise csv)"
+        ),
+    )
+
+    moodle = subparsers.add_parser("moodle", help="export pins and slides")
+    add_concurrency(moodle)
+    moodle.add_argument(
+        "--output-dir", default="moodle", help='export directory (default "moodle")'
+    )
+    moodle.add_argument(
+        "--download-concurrency",
+        type=int,
+        help="parallel slide downloads (default: DOWNLOAD_CONCURRENCY or 8)",
+    )
+    moodle.add_argument(
+        "--zip",
+        help="write the export into this zip file with an index.json (default: MOODLE_ZIP)",
+    )
+
+    serve = subparsers.add_parser(
+        "serve", help="stay connected, follow the CSV and run scheduled exports"
+    )
+    add_csv(serve)
+    add_concurrency(serve)
+    serve.add_argument("--watch-interval", type=float, help="seconds between checks")
+    serve.add_argument("--stats-interval", type=float, help="seconds; 0 disables")
+    serve.add_argument("--moodle-interval", type=float, help="seconds; 0 disables")
+    return parser
+
+
+def parse_args(argv):
+    if argv and argv[0] in LEGACY_FLAGS:
+        argv = [LEGACY_FLAGS[argv[0]], *argv[1:]]
+    return build_parser().parse_args(argv)
+
+
+def apply_overrides(args):
+    """
+    Copies command-line options over the environment-based settings. This has
+    to happen before the action modules are imported, since they read config
+    values at import time.
+    """
+    import config
+
+    if getattr(args, "csv", None):
+        config.CSV_FILE = args.csv
+        if not os.getenv("STATE_FILE"):
+            config.STATE_FILE = config.default_state_file(args.csv)
+    overrides = {
+        "CONCURRENCY": getattr(args, "concurrency", None),
+        "METRICS_FILE": args.metrics_file,
+        "DOWNLOAD_CONCURRENCY": getattr(args, "download_concurrency", None),
+        "MOODLE_ZIP": getattr(args, "zip", None),
+        "GUILDS_FILE": getattr(args, "guilds", None),
+        "WATCH_INTERVAL": getattr(args, "watch_interval", None),
+        "STATS_INTERVAL": getattr(args, "stats_interval", None),
+        "MOODLE_INTERVAL": getattr(args, "moodle_interval", None),
+    }
+    if args.command == "add":
+        overrides["STATE_FILE"] = args.state_file
+    elif args.command == "stats":
+        overrides["STATS_STATE_FILE"] = args.state_file
+        overrides["STATS_LONG_FORMAT"] = args.long_format
+    for name, value in overrides.items():
+        if value is not None:
+            setattr(config, name, value)
+    return config
+
+
+def load_guilds_file(args, config):
+    """
+    Returns the guilds to process for a multi-guild add or remove, or None to
+    use GUILD_ID and CSV_FILE. Exits on a guilds file that cannot be used.
+    """
+    if args.command not in MULTI_GUILD_COMMANDS or not config.GUILDS_FILE:
+        return None
+    if args.csv or getattr(args, "state_file", None):
+        print("--csv and --state-file cannot be combined with a guilds file.")
+        sys.exit(1)
+
+    from guilds import GuildsFileError, load_guilds
+
+    try:
+        return load_guilds(config.GUILDS_FILE)
+    except FileNotFoundError:
+        print(f"Guilds file '{config.GUILDS_FILE}' not found.")
+    except GuildsFileError as e:
+        print(e)
     sys.exit(1)
-OPERATION_MODE = sys.argv[1]
-
-# Set up the Discord client with the required intents.
-intents = discord.Intents.default()
-intents.messages = True
-intents.guilds = True
-intents.message_content = True  # Needed for reading message content
-client = discord.Client(intents=intents)
-
-
-@client.event
-async def on_ready():
-    print(f"Logged in as {client.user}")
-    if OPERATION_MODE == "--add":
-        await process_csv_add(client)
-    elif OPERATION_MODE == "--remove":
-        await process_csv_remove(client)
-    elif OPERATION_MODE == "--stats":
-        await process_stats(client)
-    elif OPERATION_MODE == "--moodle":
-        await process_moodle(client)
-    await client.close()
-
-
-assert TOKEN is not None, "Please set the TOKEN in config.py"
-client.run(TOKEN)
+
+
+async def run_command(client, args, guilds=None):
+    # Each command imports only what it needs: pandas and numpy are loaded by
+    # "stats", pdf2image and Pillow by "moodle", neither by "add" or "remove".
+    if guilds is not None:
+        from guilds import run_guilds
+
+        options = {"dry_run": args.dry_run}
+        if args.command == "add":
+            options["rebuild_cache"] = args.rebuild_cache
+        else:
+            options["archive"] = args.archive
+        await run_guilds(client, guilds, args.command, **options)
+    elif args.command == "add":
+        from actions import process_csv_add
+
+        await process_csv_add(
+            client, dry_run=args.dry_run, rebuild_cache=args.rebuild_cache
+        )
+    elif args.command == "remove":
+        from actions import process_csv_remove
+
+        await process_csv_remove(client, dry_run=args.dry_run, archive=args.archive)
+    elif args.command == "stats":
+        from actions import process_stats
+
+        await process_stats(client, output_prefix=args.output_prefix)
+    elif args.command == "moodle":
+        from actions import process_moodle
+
+        await process_moodle(client, moodle_dir=args.output_dir)
+    elif args.command == "serve":
+        from daemon import serve
+
+        await serve(client)
+
+
+def main(argv=None):
+    args = parse_args(sys.argv[1:] if argv is None else argv)
+    config = apply_overrides(args)
+    guilds = load_guilds_file(args, config)
+    # The guilds file replaces GUILD_ID and CSV_FILE.
+    required = ("TOKEN",) if guilds is not None else REQUIRED[args.command]
+    errors = config.missing_settings(required)
+    if errors:
+        for error in errors:
+            print(error)
+        sys.exit(1)
+
+    import discord
+
+    from metrics import metrics
+
+    # Set up the Discord client with the required intents.
+    intents = discord.Intents.default()
+    intents.messages = True
+    intents.guilds = True
+    intents.message_content = True  # Needed for reading message content
+    client = discord.Client(intents=intents)
+    # Record every Discord API call made through this client (see metrics.py).
+    metrics.instrument_client(client)
+
+    # on_ready fires again after every reconnect; the command must only start once.
+    started = False
+
+    @client.event
+    async def on_ready():
+        nonlocal started
+        print(f"Logged in as {client.user}")
+        if started:
+            return
+        started = True
+        try:
+            with metrics.action(args.command):
+                await run_command(client, args, guilds)
+        finally:
+            metrics.print_summary()
+            if config.METRICS_FILE:
+                try:
+                    metrics.save(config.METRICS_FILE)
+                except Exception as e:
+                    print(f"Error saving metrics to '{config.METRICS_FILE}': {e}")
+            await client.close()
+
+    client.run(config.TOKEN)
+
+
+# Guarded so worker processes (thumbnail rendering in moodle) that re-import
+# this module under the "spawn" start method do not log in a second client.
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,298 @@
+import contextvars
+import logging
+import os
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+import aiohttp
+
+from state import write_json_atomic, write_text_atomic
+
+# Upper bounds (seconds) of the latency histogram buckets; slower calls land
+# in a final overflow bucket.
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+METRIC_PREFIX = "presentation_bot"
+
+# The action ("add", "stats", ...) whose calls are being recorded. Tasks copy
+# the context they are created in, so concurrent workers inherit it.
+current_action = contextvars.ContextVar("current_action", default="-")
+# The Discord route of the request in flight, so rate-limit warnings logged by
+# discord.py can be attributed to it.
+_current_endpoint = contextvars.ContextVar("current_endpoint", default=None)
+
+
+class OperationStats:
+    """Call count, errors, latency histogram and rate-limit waits of one endpoint."""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.total_time = 0.0
+        self.max_time = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.rate_limited = 0
+        self.rate_limit_wait = 0.0
+
+    def observe(self, seconds, error=False):
+        self.calls += 1
+        self.errors += bool(error)
+        self.total_time += seconds
+        self.max_time = max(self.max_time, seconds)
+        self.buckets[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def quantile(self, q):
+        """Approximates a latency quantile by the upper bound of its bucket."""
+        if not self.calls:
+            return 0.0
+        rank = q * self.calls
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max_time)
+        return self.max_time
+
+    def to_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "total_time": round(self.total_time, 6),
+            "max_time": round(self.max_time, 6),
+            # [upper bound, calls] pairs, not cumulative; the last bound is "+Inf".
+            "latency_buckets": [
+                [bound, count]
+                for bound, count in zip(LATENCY_BUCKETS + ("+Inf",), self.buckets)
+            ],
+            "rate_limited": self.rate_limited,
+            "rate_limit_wait": round(self.rate_limit_wait, 6),
+        }
+
+
+class Metrics:
+    """
+    Per-action, per-endpoint counters for a run. Discord requests are recorded
+    by wrapping the client's HTTP layer (endpoints are route templates such as
+    "GET /channels/{channel_id}/pins", so all channels share one row), 429
+    sleeps by listening to discord.py's rate-limit warnings, slide downloads
+    through an aiohttp trace config, and local work (e.g. PDF rendering) with
+    timer().
+    """
+
+    def __init__(self):
+        self.operations = {}  # (action, endpoint) -> OperationStats
+        self.started = time.perf_counter()
+
+    def stats(self, endpoint, action=None):
+        key = (action or current_action.get(), endpoint)
+        stats = self.operations.get(key)
+        if stats is None:
+            stats = self.operations[key] = OperationStats()
+        return stats
+
+    def observe(self, endpoint, seconds, error=False):
+        self.stats(endpoint).observe(seconds, error)
+
+    def record_rate_limit(self, endpoint, seconds):
+        stats = self.stats(endpoint)
+        stats.rate_limited += 1
+        stats.rate_limit_wait += seconds
+
+    def totals(self, action):
+        """
+        Returns (calls, 429 responses) recorded for action, leaving out the
+        "(total)" and "(retry backoff)" rows.
+        """
+        calls = rate_limited = 0
+        for (name, endpoint), stats in self.operations.items():
+            if name == action and not endpoint.startswith("("):
+                calls += stats.calls
+                rate_limited += stats.rate_limited
+        return calls, rate_limited
+
+    @contextmanager
+    def action(self, name):
+        """Attributes everything recorded inside the block to the action `name`."""
+        token = current_action.set(name)
+        try:
+            with self.timer("(total)"):
+                yield
+        finally:
+            current_action.reset(token)
+
+    @contextmanager
+    def timer(self, endpoint):
+        """Records the time spent in the block as one call to `endpoint`."""
+        start = time.perf_counter()
+        error = False
+        try:
+            yield
+        except BaseException:
+            error = True
+            raise
+        finally:
+            self.observe(endpoint, time.perf_counter() - start, error)
+
+    def instrument_client(self, client):
+        """Wraps the client's HTTP layer so every Discord request is recorded."""
+        http = getattr(client, "http", None)
+        if http is None or getattr(http.request, "_instrumented", False):
+            return
+        request = http.request
+
+        async def instrumented_request(route, **kwargs):
+            endpoint = f"{route.method} {route.path}"
+            token = _current_endpoint.set(endpoint)
+            try:
+                with self.timer(endpoint):
+                    return await request(route, **kwargs)
+            finally:
+                _current_endpoint.reset(token)
+
+        instrumented_request._instrumented = True
+        http.request = instrumented_request
+
+        handler = RateLimitLogHandler(self)
+        logger = logging.getLogger("discord.http")
+        if not any(isinstance(h, RateLimitLogHandler) for h in logger.handlers):
+            logger.addHandler(handler)
+
+    def trace_config(self):
+        """Returns an aiohttp TraceConfig recording each request per host."""
+        trace_config = aiohttp.TraceConfig()
+
+        async def on_request_start(session, context, params):
+            context.start = time.perf_counter()
+            context.endpoint = f"{params.method} {params.url.host}"
+
+        async def on_request_end(session, context, params):
+            error = params.response.status >= 400
+            self.observe(context.endpoint, time.perf_counter() - context.start, error)
+
+        async def on_request_exception(session, context, params):
+            self.observe(context.endpoint, time.perf_counter() - context.start, True)
+
+        trace_config.on_request_start.append(on_request_start)
+        trace_config.on_request_end.append(on_request_end)
+        trace_config.on_request_exception.append(on_request_exception)
+        return trace_config
+
+    def print_summary(self):
+        # Per-guild actions ("add:{name}") can be longer than the usual ones.
+        width = max([10] + [len(action) + 2 for action, _ in self.operations])
+        header = (
+            f"{'action':<{width}}{'endpoint':<56}{'calls':>7}{'errors':>7}"
+            f"{'total s':>10}{'mean ms':>9}{'p95 ms':>9}{'max ms':>9}"
+            f"{'429s':>6}{'429 wait s':>11}"
+        )
+        print("\nMetrics:")
+        print(header)
+        print("-" * len(header))
+        for (action, endpoint), s in sorted(self.operations.items()):
+            mean = s.total_time / s.calls if s.calls else 0.0
+            print(
+                f"{action:<{width}}{endpoint[:55]:<56}{s.calls:>7}{s.errors:>7}"
+                f"{s.total_time:>10.2f}{mean * 1000:>9.1f}"
+                f"{s.quantile(0.95) * 1000:>9.1f}{s.max_time * 1000:>9.1f}"
+                f"{s.rate_limited:>6}{s.rate_limit_wait:>11.2f}"
+            )
+
+    def to_dict(self):
+        return {
+            "wall_time": round(time.perf_counter() - self.started, 6),
+            "operations": [
+                {"action": action, "endpoint": endpoint, **stats.to_dict()}
+                for (action, endpoint), stats in sorted(self.operations.items())
+            ],
+        }
+
+    def to_prometheus(self):
+        """Renders the counters in the Prometheus text exposition format."""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {METRIC_PREFIX}_{name} {help_text}")
+            lines.append(f"# TYPE {METRIC_PREFIX}_{name} {kind}")
+
+        def sample(name, labels, value):
+            label_text = ",".join(
+                f'{k}="{_escape_label(v)}"' for k, v in labels.items()
+            )
+            lines.append(f"{METRIC_PREFIX}_{name}{{{label_text}}} {value}")
+
+        items = sorted(self.operations.items())
+        family("calls_total", "counter", "Calls per action and endpoint.")
+        for (action, endpoint), s in items:
+            sample("calls_total", {"action": action, "endpoint": endpoint}, s.calls)
+        family("errors_total", "counter", "Failed calls per action and endpoint.")
+        for (action, endpoint), s in items:
+            sample("errors_total", {"action": action, "endpoint": endpoint}, s.errors)
+        family("call_duration_seconds", "histogram", "Call latency in seconds.")
+        for (action, endpoint), s in items:
+            labels = {"action": action, "endpoint": endpoint}
+            cumulative = 0
+            for bound, count in zip(LATENCY_BUCKETS, s.buckets):
+                cumulative += count
+                sample(
+                    "call_duration_seconds_bucket", {**labels, "le": bound}, cumulative
+                )
+            sample("call_duration_seconds_bucket", {**labels, "le": "+Inf"}, s.calls)
+            sample("call_duration_seconds_sum", labels, s.total_time)
+            sample("call_duration_seconds_count", labels, s.calls)
+        family("rate_limited_total", "counter", "429 responses per endpoint.")
+        for (action, endpoint), s in items:
+            labels = {"action": action, "endpoint": endpoint}
+            sample("rate_limited_total", labels, s.rate_limited)
+        family(
+            "rate_limit_wait_seconds_total",
+            "counter",
+            "Seconds spent sleeping on 429 responses.",
+        )
+        for (action, endpoint), s in items:
+            labels = {"action": action, "endpoint": endpoint}
+            sample("rate_limit_wait_seconds_total", labels, s.rate_limit_wait)
+        return "\n".join(lines) + "\n"
+
+    def save(self, path):
+        """
+        Writes the metrics to path: Prometheus text format for a ".prom" file
+        (for node_exporter's textfile collector), JSON otherwise.
+        """
+        if os.path.splitext(path)[1] == ".prom":
+            write_text_atomic(path, self.to_prometheus())
+        else:
+            write_json_atomic(path, self.to_dict())
+        print(f"Saved metrics to '{path}'.")
+
+
+class RateLimitLogHandler(logging.Handler):
+    """
+    Records the sleeps discord.py announces with "We are being rate limited.
+    {method} {url} responded with 429. Retrying in {seconds} seconds." against
+    the route of the request in flight.
+    """
+
+    def __init__(self, metrics):
+        super().__init__(level=logging.WARNING)
+        self.metrics = metrics
+
+    def emit(self, record):
+        try:
+            message = str(record.msg)
+            if not message.startswith("We are being rate limited."):
+                return
+            if "Retrying in" not in message:
+                return  # discord.py raises RateLimited instead of sleeping.
+            method, url, retry_after = record.args[:3]
+            endpoint = _current_endpoint.get() or f"{method} {url}"
+            self.metrics.record_rate_limit(endpoint, float(retry_after))
+        except Exception:
+            self.handleError(record)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+# Shared by every module, like the configuration.
+metrics = Metrics()
@@ -0,0 +1,518 @@
+import asyncio
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime
+
+import discord
+
+from concurrency import run_bounded, with_retries
+from config import ARCHIVE_CATEGORY, GUILD_ROUTE_CONCURRENCY
+from schedule import DATE_FORMAT, load_schedule, parse_date
+from state import content_hash
+
+# Kinds of change the planner can emit, in the order the executor applies them.
+CREATE_CATEGORY = "create_category"
+CREATE = "create"
+PIN = "pin"
+UPDATE_PIN = "update_pin"
+DELETE = "delete"
+ARCHIVE = "archive"
+DELETE_CATEGORY = "delete_category"
+NOOP = "noop"
+
+# Discord allows at most this many channels in one category.
+CATEGORY_CHANNEL_LIMIT = 50
+
+
+@dataclass(slots=True)
+class DesiredChannel:
+    """A presentation channel as described by one CSV row."""
+
+    record_id: str
+    category_name: str
+    channel_name: str
+    content: str
+
+
+@dataclass
+class Change:
+    """A single mutation (or deliberate no-op) the executor has to apply."""
+
+    kind: str
+    category_name: str
+    channel_name: str = None
+    content: str = None
+    record_id: str = None
+    channel: object = None  # existing discord channel or category, if any
+    message: object = None  # existing pinned bot message, if any
+    target: str = None  # category an ARCHIVE change moves the channel into
+
+    def describe(self):
+        target = self.channel_name or self.category_name
+        if self.target is not None:
+            target = f"{target} -> {self.target}"
+        return f"{self.kind:<16} {target}"
+
+
+def category_name_for(dt):
+    return f"{dt.strftime('%B')} Presentations"
+
+
+# Field and label of each line of the pinned message, in order.
+PINNED_FIELDS = (
+    ("paper_title", "**📜 Paper being presented**"),
+    ("paper_link", "**🌐 Paper Link**"),
+    ("date_text", "**📅 Presentation Date**"),
+    ("presenters", "**🗣️ Presenter(s)**"),
+    ("topic", "**🗃️ Topic Category**"),
+)
+
+
+@dataclass(slots=True, frozen=True)
+class PinnedDetails:
+    """The fields of a pinned presentation message, as parsed back from it."""
+
+    paper_title: str
+    paper_link: str
+    date_text: str  # as written in the pin, e.g. "Monday, April 07, 2025"
+    date: datetime  # None if date_text does not parse
+    presenters: str
+    topic: str
+
+
+def format_pinned_message(paper_title, paper_link, dt, presenter, topic_category):
+    values = (
+        paper_title,
+        paper_link,
+        dt.strftime(DATE_FORMAT),
+        presenter,
+        topic_category,
+    )
+    return "\n".join(
+        f"{label}: {value}" for (_, label), value in zip(PINNED_FIELDS, values)
+    )
+
+
+def parse_pinned_message(content):
+    """
+    Reads the fields back out of a message written by format_pinned_message.
+    Returns None if it has no presentation date line; other missing fields
+    are left empty.
+    """
+    values = {}
+    for line in content.splitlines():
+        for field, label in PINNED_FIELDS:
+            if field not in values and line.startswith(f"{label}:"):
+                values[field] = line[len(label) + 1 :].strip()
+                break
+    if "date_text" not in values:
+        return None
+    try:
+        date = parse_date(values["date_text"])
+    except ValueError:
+        date = None
+    return PinnedDetails(
+        paper_title=values.get("paper_title", ""),
+        paper_link=values.get("paper_link", ""),
+        date_text=values["date_text"],
+        date=date,
+        presenters=values.get("presenters", ""),
+        topic=values.get("topic", ""),
+    )
+
+
+def load_desired_state(csv_file):
+    """
+    Loads and validates the schedule (see schedule.load_schedule) and returns
+    (category_names, channels) where category_names lists every month
+    category in first-seen order and channels is a list of DesiredChannel for
+    the rows that name a Discord channel. Raises schedule.ScheduleError with
+    every problem found, and FileNotFoundError if the file does not exist.
+    """
+    category_names = {}  # dict keeps insertion order
+    channels = []
+    for record in load_schedule(csv_file).records:
+        category_name = category_name_for(record.date)
+        category_names[category_name] = None
+        if record.channel_name is None:
+            continue
+        channels.append(
+            DesiredChannel(
+                record_id=record.record_id,
+                category_name=category_name,
+                channel_name=record.channel_name,
+                content=format_pinned_message(
+                    record.paper_title,
+                    record.paper_link,
+                    record.date,
+                    record.presenters,
+                    record.topic,
+                ),
+            )
+        )
+    return list(category_names), channels
+
+
+class GuildIndex:
+    """
+    The current state of a guild, indexed in a single pass over the client's
+    cache so lookups during planning are O(1) instead of linear scans.
+    """
+
+    def __init__(self, guild):
+        self.guild = guild
+        self.categories = {}  # name -> category
+        self.channels = {}  # (category id, channel name) -> channel
+        self.channels_by_id = {}  # channel id -> channel
+        self.category_channel_ids = defaultdict(set)  # category id -> channel ids
+
+        for category in guild.categories:
+            self.categories.setdefault(category.name, category)
+        for channel in guild.channels:
+            category_id = getattr(channel, "category_id", None)
+            if category_id is None or channel.id == category_id:
+                continue
+            self.channels_by_id[channel.id] = channel
+            self.category_channel_ids[category_id].add(channel.id)
+            self.channels.setdefault((category_id, channel.name), channel)
+
+    def find_channel(self, category_name, channel_name):
+        category = self.categories.get(category_name)
+        if category is None:
+            return None
+        return self.channels.get((category.id, channel_name))
+
+
+async def fetch_bot_pins(channels, bot_user_id):
+    """
+    Fetches the pins of the given channels concurrently and returns a dict of
+    channel id -> the bot's pinned message (or None if the bot has none).
+    """
+    bot_pins = {}
+
+    async def fetch(channel):
+        pinned_messages = await with_retries(
+            channel.pins, label=f"Retrieving pins in '{channel.name}'"
+        )
+        bot_pins[channel.id] = next(
+            (m for m in pinned_messages if m.author.id == bot_user_id), None
+        )
+
+    failures = await run_bounded(channels, fetch)
+    for channel, e in failures:
+        print(f"Error retrieving pins in '{channel.name}': {e}")
+    return bot_pins
+
+
+async def plan_add(
+    category_names, desired, index, bot_user_id, state=None, snapshot=None
+):
+    """
+    Diffs the desired channels against the guild index and returns the list of
+    changes needed to bring the guild in sync with the CSV. Channels with a
+    matching state cache entry are decided from the cached content hash; pins
+    are only fetched for existing channels the cache knows nothing about, and
+    not even for those if a GuildSnapshot already holds them.
+    """
+    changes = []
+    for category_name in category_names:
+        if category_name not in index.categories:
+            changes.append(Change(CREATE_CATEGORY, category_name))
+
+    existing = {}  # record id -> channel
+    cached = {}  # record id -> state cache entry
+    for item in desired:
+        channel = index.find_channel(item.category_name, item.channel_name)
+        if channel is None:
+            continue
+        existing[item.record_id] = channel
+        entry = state.lookup(item.record_id, channel.id) if state is not None else None
+        if entry is not None:
+            cached[item.record_id] = entry
+
+    uncached = [c for record_id, c in existing.items() if record_id not in cached]
+    bot_pins = snapshot.bot_pins(uncached) if snapshot is not None else {}
+    bot_pins.update(
+        await fetch_bot_pins([c for c in uncached if c.id not in bot_pins], bot_user_id)
+    )
+
+    for item in desired:
+        channel = existing.get(item.record_id)
+        entry = cached.get(item.record_id)
+        if channel is None:
+            kind, message = CREATE, None
+        elif entry is not None:
+            if entry["message_id"] is None:
+                kind, message = PIN, None
+            else:
+                message = channel.get_partial_message(entry["message_id"])
+                if entry["content_hash"] == content_hash(item.content):
+                    kind = NOOP
+                else:
+                    kind = UPDATE_PIN
+        elif channel.id not in bot_pins:
+            continue  # Pins could not be read; leave the channel alone.
+        else:
+            message = bot_pins[channel.id]
+            if message is None:
+                kind = PIN
+            elif message.content != item.content:
+                kind = UPDATE_PIN
+            else:
+                kind = NOOP
+        changes.append(
+            Change(
+                kind,
+                item.category_name,
+                item.channel_name,
+                item.content,
+                record_id=item.record_id,
+                channel=channel,
+                message=message,
+            )
+        )
+    return changes
+
+
+def archive_category_names(archive_name=ARCHIVE_CATEGORY):
+    """Yields "Archive", "Archive 2", "Archive 3", ... for a base name."""
+    yield archive_name
+    number = 2
+    while True:
+        yield f"{archive_name} {number}"
+        number += 1
+
+
+def plan_remove(category_names, desired, index, archive=False):
+    """
+    Returns the changes needed to delete every desired channel that exists,
+    followed by the deletion of categories left empty by those deletions.
+    Emptiness is computed from the index, not from the (possibly stale) cache.
+    With archive, the channels are moved into the ARCHIVE_CATEGORY category
+    instead (spilling into "... 2", "... 3" once a category holds
+    CATEGORY_CHANNEL_LIMIT channels), which is created if it is missing.
+    """
+    changes = []
+    archive_targets = archive_category_names() if archive else None
+    archive_name = archive_free = None
+    removed_ids = defaultdict(set)  # category id -> channel ids being deleted
+    touched = {}  # category name -> category
+
+    for category_name in category_names:
+        category = index.categories.get(category_name)
+        if category is None:
+            print(f"Category '{category_name}' not found; skipping its records.")
+            continue
+        touched[category_name] = category
+
+    for item in desired:
+        category = touched.get(item.category_name)
+        if category is None:
+            continue
+        channel = index.find_channel(item.category_name, item.channel_name)
+        if channel is None:
+            print(f"Channel '{item.channel_name}' not found in '{item.category_name}'.")
+            continue
+        removed_ids[category.id].add(channel.id)
+        if archive_targets is not None:
+            while not archive_free:
+                archive_name = next(archive_targets)
+                existing = index.categories.get(archive_name)
+                if existing is None:
+                    changes.append(Change(CREATE_CATEGORY, archive_name))
+                    archive_free = CATEGORY_CHANNEL_LIMIT
+                else:
+                    used = len(index.category_channel_ids[existing.id])
+                    archive_free = CATEGORY_CHANNEL_LIMIT - used
+            archive_free -= 1
+        changes.append(
+            Change(
+                ARCHIVE if archive_targets is not None else DELETE,
+                item.category_name,
+                item.channel_name,
+                record_id=item.record_id,
+                channel=channel,
+                target=archive_name if archive_targets is not None else None,
+            )
+        )
+
+    for category_name, category in touched.items():
+        remaining = index.category_channel_ids[category.id] - removed_ids[category.id]
+        if not remaining:
+            changes.append(Change(DELETE_CATEGORY, category_name, channel=category))
+    return changes
+
+
+def print_plan(changes):
+    counts = defaultdict(int)
+    for change in changes:
+        counts[change.kind] += 1
+        if change.kind != NOOP:
+            print(f"  {change.describe()}")
+    summary = ", ".join(f"{kind}: {count}" for kind, count in counts.items())
+    print(f"Planned changes: {summary or 'none'}")
+
+
+async def apply_changes(index, changes, state=None):
+    """
+    Applies a change set produced by plan_add/plan_remove. Categories are
+    created first, channel-level changes run through the bounded worker pool
+    and categories are deleted last, after one refresh of their membership
+    from the guild. When a state cache is given it is updated with every
+    channel and pinned message written. Returns the failed changes, including
+    those skipped because their category could not be created.
+    """
+    guild = index.guild
+    guild_route = asyncio.Semaphore(max(1, GUILD_ROUTE_CONCURRENCY))
+    categories = dict(index.categories)
+    removed = set()  # ids of channels deleted or archived by this batch
+    failed = []
+
+    for change in changes:
+        if change.kind != CREATE_CATEGORY:
+            continue
+        print(f"Creating category: {change.category_name}")
+        try:
+            categories[change.category_name] = await with_retries(
+                guild.create_category,
+                change.category_name,
+                label=f"Creating category '{change.category_name}'",
+            )
+        except Exception as e:
+            print(f"Error creating category '{change.category_name}': {e}")
+            failed.append(change)
+
+    async def send_and_pin(channel, change):
+        msg = await with_retries(
+            channel.send, change.content, label=f"Sending message in '{channel.name}'"
+        )
+        await with_retries(msg.pin, label=f"Pinning message in '{channel.name}'")
+        if state is not None:
+            state.set(change.record_id, channel.id, msg.id, change.content)
+
+    async def apply(change):
+        name = change.channel_name
+        if change.kind == CREATE:
+            category = categories[change.category_name]
+            print(f"Creating channel: {name} in {change.category_name}")
+            async with guild_route:
+                channel = await with_retries(
+                    guild.create_text_channel,
+                    name,
+                    category=category,
+                    label=f"Creating channel '{name}'",
+                )
+            if state is not None:
+                state.set(change.record_id, channel.id, None, change.content)
+            await send_and_pin(channel, change)
+            print(f"Sent and pinned message in channel '{name}'.")
+        elif change.kind == PIN:
+            await send_and_pin(change.channel, change)
+            print(f"Sent and pinned new message in '{name}'.")
+        elif change.kind == UPDATE_PIN:
+            # A single edit keeps the pin and does not notify members, unlike
+            # deleting the message and sending and pinning a new one.
+            try:
+                await with_retries(
+                    change.message.edit,
+                    content=change.content,
+                    label=f"Editing pinned message in '{name}'",
+                )
+            except discord.NotFound:
+                # Deleted by hand since it was cached; post and pin a new one.
+                await send_and_pin(change.channel, change)
+                print(f"Re-sent and pinned message in '{name}'.")
+                return
+            if state is not None:
+                state.set(
+                    change.record_id,
+                    change.channel.id,
+                    change.message.id,
+                    change.content,
+                )
+            print(f"Updated pinned message in '{name}'.")
+        elif change.kind == DELETE:
+            # Channel deletes are limited per channel, not per guild, so the
+            # whole batch can run in parallel.
+            print(f"Removing channel '{name}' from '{change.category_name}'.")
+            await with_retries(
+                change.channel.delete, label=f"Removing channel '{name}'"
+            )
+            removed.add(change.channel.id)
+            if state is not None:
+                state.forget(change.record_id)
+        elif change.kind == ARCHIVE:
+            print(f"Archiving channel '{name}' into '{change.target}'.")
+            await with_retries(
+                change.channel.edit,
+                category=categories[change.target],
+                sync_permissions=True,
+                label=f"Archiving channel '{name}'",
+            )
+            removed.add(change.channel.id)
+            if state is not None:
+                state.forget(change.record_id)
+
+    if state is not None:
+        # Channels confirmed up-to-date from their pins seed the cache, so the
+        # next run can skip them without a network call.
+        for change in changes:
+            if change.kind == NOOP and change.message is not None:
+                state.set(
+                    change.record_id,
+                    change.channel.id,
+                    change.message.id,
+                    change.content,
+                )
+
+    channel_changes = []
+    for change in changes:
+        if change.kind in (PIN, UPDATE_PIN, DELETE):
+            channel_changes.append(change)
+        elif change.kind in (CREATE, ARCHIVE):
+            # The category the channel goes into may have failed to create.
+            category_name = (
+                change.category_name if change.kind == CREATE else change.target
+            )
+            if category_name in categories:
+                channel_changes.append(change)
+            else:
+                print(
+                    f"Skipping channel '{change.channel_name}'; "
+                    f"category '{category_name}' could not be created."
+                )
+                failed.append(change)
+    for change, e in await run_bounded(channel_changes, apply):
+        print(f"Error in channel '{change.channel_name}': {e}")
+        failed.append(change)
+
+    category_deletes = [c for c in changes if c.kind == DELETE_CATEGORY]
+    # Re-read category membership once after the batch: channels that failed
+    # to go, or that someone added meanwhile, keep their category alive. The
+    # client cache may not have seen our own deletes yet, so those are
+    # subtracted explicitly.
+    live = GuildIndex(guild) if category_deletes else None
+    for change in category_deletes:
+        remaining = live.category_channel_ids[change.channel.id] - removed
+        if remaining:
+            print(
+                f"Keeping category '{change.category_name}'; "
+                f"{len(remaining)} channels are still in it."
+            )
+            continue
+        print(f"Removing empty category '{change.category_name}'.")
+        try:
+            await with_retries(
+                change.channel.delete,
+                label=f"Removing category '{change.category_name}'",
+            )
+        except Exception as e:
+            print(f"Error removing category '{change.category_name}': {e}")
+            failed.append(change)
+
+    skipped = sum(1 for c in changes if c.kind == NOOP)
+    if skipped:
+        print(f"{skipped} channels are up-to-date. Skipping.")
+    if failed:
+        print(f"{len(failed)} of {len(changes) - skipped} changes failed.")
+    return failed
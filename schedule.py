@@ -0,0 +1,219 @@
+import csv
+import os
+import re
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+
+DATE_FORMAT = "%A, %B %d, %Y"  # e.g., "Monday, April 7, 2025"
+
+# Columns of the schedule sheet and the value used when one is missing.
+COLUMNS = {
+    "Date": "",
+    "ID": "",
+    "Discord Channel Name": "",
+    "Paper Title": "No Title",
+    "Paper Link": "No Link",
+    "Presenters": "N/A",
+    "Topic": "N/A",
+}
+REQUIRED_COLUMNS = ("Date", "ID", "Discord Channel Name")
+# Discord's limit on channel name length, which applies to "p{ID}-{name}".
+MAX_CHANNEL_NAME_LENGTH = 100
+# Characters Discord keeps in a text channel name. Anything else (spaces,
+# capitals, punctuation) is rewritten when the channel is created, so the bot
+# would never find the channel again under the name in the sheet.
+CHANNEL_NAME_PATTERN = re.compile(r"^[\w-]+$")
+
+
+@dataclass(slots=True, frozen=True)
+class ScheduleRecord:
+    """One dated row of the schedule."""
+
+    row: int  # line in the sheet, for error messages
+    record_id: str
+    date: datetime
+    discord_channel_name: str  # without the "p{ID}-" prefix; may be empty
+    paper_title: str
+    paper_link: str
+    presenters: str
+    topic: str
+
+    @property
+    def channel_name(self):
+        """The channel's full name, or None if the row names no channel."""
+        if not self.discord_channel_name:
+            return None
+        return f"p{self.record_id}-{self.discord_channel_name}"
+
+
+@dataclass(slots=True)
+class Schedule:
+    records: list  # ScheduleRecord, in sheet order
+    by_id: dict  # record id -> ScheduleRecord (rows with an ID only)
+
+
+class ValidationError(Exception):
+    """Every problem found in an input file, listed one per line."""
+
+    def __init__(self, path, errors):
+        self.path = path
+        self.errors = errors
+        super().__init__(
+            f"{len(errors)} problem(s) in '{path}':\n"
+            + "\n".join(f"  {error}" for error in errors)
+        )
+
+
+class ScheduleError(ValidationError):
+    """Raised with every problem found in a schedule, before anything runs."""
+
+
+@lru_cache(maxsize=None)
+def parse_date(date_str):
+    """Parses a "Monday, April 7, 2025" date; memoized per distinct string."""
+    return datetime.strptime(date_str, DATE_FORMAT)
+
+
+def suggest_channel_name(name):
+    """Roughly what Discord would turn a channel name into."""
+    name = re.sub(r"\s+", "-", name.strip().lower())
+    return re.sub(r"[^\w-]", "", name)
+
+
+def read_rows(path):
+    """
+    Yields (line number, {column: text}) for each non-empty row of a CSV file
+    (as exported by Google Sheets or Excel, with or without a BOM) or of the
+    first sheet of an .xlsx workbook. Header names are stripped of whitespace.
+    """
+    if os.path.splitext(path)[1].lower() == ".xlsx":
+        yield from read_xlsx_rows(path)
+        return
+    with open(path, newline="", encoding="utf-8-sig") as f:
+        reader = csv.reader(f)
+        header = [name.strip() for name in next(reader, [])]
+        for values in reader:
+            if any(value.strip() for value in values):
+                yield reader.line_num, make_row(header, values)
+
+
+def read_xlsx_rows(path):
+    try:
+        import openpyxl
+    except ImportError:
+        raise ScheduleError(
+            path,
+            ["Reading .xlsx files requires openpyxl (poetry install --extras xlsx)."],
+        )
+    workbook = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        rows = workbook.worksheets[0].iter_rows(values_only=True)
+        header = [str(name or "").strip() for name in next(rows, ())]
+        for line, values in enumerate(rows, start=2):
+            values = [cell_text(value) for value in values]
+            if any(values):
+                yield line, make_row(header, values)
+    finally:
+        workbook.close()
+
+
+def make_row(header, values):
+    """Maps header names to values; cells missing from a short row are None."""
+    return {
+        name: values[i] if i < len(values) else None for i, name in enumerate(header)
+    }
+
+
+def cell_text(value):
+    """Spreadsheet cell to text: dates in DATE_FORMAT, 12.0 as "12"."""
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime(DATE_FORMAT)
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+def load_schedule(path):
+    """
+    Reads the schedule in one pass into ScheduleRecords and validates all of
+    it up front: missing columns, unparseable dates, channel rows without an
+    ID, duplicate IDs and channel names Discord would reject or rename.
+    Rows without a date are skipped. Raises ScheduleError listing every
+    problem, and FileNotFoundError if the file does not exist.
+    """
+    records = []
+    by_id = {}
+    errors = []
+    header_checked = False
+
+    for line, row in read_rows(path):
+        if not header_checked:
+            header_checked = True
+            missing = [c for c in REQUIRED_COLUMNS if c not in row]
+            if missing:
+                raise ScheduleError(path, [f"Missing column(s): {', '.join(missing)}."])
+
+        values = {
+            column: (default if row.get(column) is None else row[column]).strip()
+            for column, default in COLUMNS.items()
+        }
+        date_str = values["Date"]
+        if not date_str:
+            continue  # Skip if no date
+
+        try:
+            date = parse_date(date_str)
+        except ValueError:
+            errors.append(
+                f"Row {line}: date '{date_str}' does not look like 'Monday, April 7, 2025'."
+            )
+            continue
+
+        record_id = values["ID"]
+        channel = values["Discord Channel Name"]
+        if channel:
+            if not record_id:
+                errors.append(f"Row {line}: channel '{channel}' has no ID.")
+                continue
+            full_name = f"p{record_id}-{channel}"
+            if (
+                not CHANNEL_NAME_PATTERN.match(full_name)
+                or full_name != full_name.lower()
+            ):
+                errors.append(
+                    f"Row {line}: channel name '{full_name}' is not a valid Discord "
+                    f"channel name; use lowercase letters, digits, '-' and '_' "
+                    f"(e.g. '{suggest_channel_name(full_name)}')."
+                )
+            elif len(full_name) > MAX_CHANNEL_NAME_LENGTH:
+                errors.append(
+                    f"Row {line}: channel name '{full_name}' is longer than "
+                    f"{MAX_CHANNEL_NAME_LENGTH} characters."
+                )
+
+        record = ScheduleRecord(
+            row=line,
+            record_id=record_id,
+            date=date,
+            discord_channel_name=channel,
+            paper_title=values["Paper Title"],
+            paper_link=values["Paper Link"],
+            presenters=values["Presenters"],
+            topic=values["Topic"],
+        )
+        if record_id:
+            previous = by_id.get(record_id)
+            if previous is not None:
+                errors.append(
+                    f"Row {line}: ID '{record_id}' is already used in row {previous.row}."
+                )
+                continue
+            by_id[record_id] = record
+        records.append(record)
+
+    if errors:
+        raise ScheduleError(path, errors)
+    return Schedule(records, by_id)
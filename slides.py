@@ -0,0 +1,369 @@
+import asyncio
+import hashlib
+import json
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timezone
+
+import aiohttp
+from pdf2image import convert_from_path
+
+from concurrency import run_bounded, with_retries
+from config import (
+    DOWNLOAD_CHUNK_SIZE,
+    DOWNLOAD_CONCURRENCY,
+    DOWNLOAD_TIMEOUT,
+    MAX_SLIDES_SIZE,
+    SLIDES_CACHE_DIR,
+    SLIDES_EXPORT_URL,
+    THUMBNAIL_FORMAT,
+    THUMBNAIL_WIDTH,
+    THUMBNAIL_WORKERS,
+)
+from metrics import metrics
+from state import load_json, write_json_atomic
+
+# Google Slides URLs (assuming they begin with 'https://docs.google.com/presentation/d/').
+SLIDES_URL_PATTERN = re.compile(r"https://docs\.google\.com/presentation/d/([^/\s]+)")
+
+
+@dataclass
+class SlideJob:
+    """One Google Slides deck found in a channel, to be exported as PDF."""
+
+    channel_name: str
+    channel_dir: str  # None when exporting into a zip bundle instead
+    number: int  # used for the slides_{N}.pdf / thumbnail_{N}.png file names
+    presentation_id: str
+    entry: dict = None  # manifest entry; "files" and "sha256" of the artifacts
+    refresh: bool = False  # already exported; only redone if the deck changed
+
+    @property
+    def download_url(self):
+        # Construct the download URL for the slides (export as PDF)
+        return SLIDES_EXPORT_URL.format(presentation_id=self.presentation_id)
+
+
+def find_presentation_ids(content):
+    """Returns the presentation ids of all Google Slides URLs in a message."""
+    return SLIDES_URL_PATTERN.findall(content)
+
+
+# Pillow format name and file extension for each supported THUMBNAIL_FORMAT.
+THUMBNAIL_FORMATS = {
+    "png": ("PNG", "png"),
+    "webp": ("WEBP", "webp"),
+    "jpeg": ("JPEG", "jpg"),
+    "jpg": ("JPEG", "jpg"),
+}
+
+
+class SlidesTooLargeError(Exception):
+    """Raised when a slide export is larger than MAX_SLIDES_SIZE."""
+
+
+def render_thumbnail(pdf_file_path, thumbnail_file_path, width, image_format):
+    """
+    Renders only the first page of the PDF, scaled by poppler straight to the
+    given width (aspect ratio preserved), and saves it in image_format. Runs in
+    a worker process. Returns False if the PDF has no pages.
+    """
+    images = convert_from_path(
+        pdf_file_path, first_page=1, last_page=1, size=(width, None)
+    )
+    if not images:
+        return False
+    tmp_path = f"{thumbnail_file_path}.tmp"
+    images[0].save(tmp_path, image_format)
+    os.replace(tmp_path, thumbnail_file_path)
+    return True
+
+
+def link_artifact(source, target):
+    """
+    Places a cached artifact at target as a hard link (falling back to a copy
+    where links are not supported), replacing whatever was there.
+    """
+    tmp_path = f"{target}.tmp"
+    if os.path.lexists(tmp_path):
+        os.remove(tmp_path)
+    try:
+        os.link(source, tmp_path)
+    except OSError:
+        shutil.copyfile(source, tmp_path)
+    os.replace(tmp_path, target)
+
+
+class SlideCache:
+    """
+    Content-addressed store of exported decks under SLIDES_CACHE_DIR:
+    "pdf/{sha256}.pdf" and "thumbnails/{sha256}-{width}.{ext}", plus an index
+    mapping each presentation id to its current hash and the ETag and
+    Last-Modified headers of the response it came from.
+
+    Within a run every presentation is fetched once and every PDF rendered
+    once, however many channels link to it. Across runs the index turns
+    refreshes into conditional requests, so unchanged decks cost a 304.
+    """
+
+    def __init__(self, root):
+        self.root = root
+        self.index_path = os.path.join(root, "index.json")
+        os.makedirs(os.path.join(root, "pdf"), exist_ok=True)
+        os.makedirs(os.path.join(root, "thumbnails"), exist_ok=True)
+        self.presentations = load_json(self.index_path, {}).get("presentations", {})
+        self._fetches = {}  # presentation id -> task resolving to the PDF hash
+        self._renders = {}  # thumbnail path -> task resolving to rendered or not
+
+    def pdf_path(self, digest):
+        return os.path.join(self.root, "pdf", f"{digest}.pdf")
+
+    def thumbnail_path(self, digest, extension):
+        return os.path.join(
+            self.root, "thumbnails", f"{digest}-{THUMBNAIL_WIDTH}.{extension}"
+        )
+
+    def artifacts(self, entry):
+        """
+        Returns the cached (PDF, thumbnail) paths of an exported manifest entry,
+        or None if the entry was never exported or the cache no longer has both.
+        """
+        digest = entry.get("sha256")
+        files = entry.get("files", [])
+        if digest is None or len(files) != 2:
+            return None
+        extension = os.path.splitext(files[1])[1][1:]
+        paths = (self.pdf_path(digest), self.thumbnail_path(digest, extension))
+        return paths if all(os.path.exists(path) for path in paths) else None
+
+    async def fetch(self, session, job):
+        """Returns the hash of the job's PDF, downloading it at most once per run."""
+        task = self._fetches.get(job.presentation_id)
+        if task is None:
+            task = asyncio.ensure_future(
+                with_retries(
+                    self._fetch,
+                    session,
+                    job,
+                    label=f"Downloading slides PDF for presentation {job.presentation_id}",
+                )
+            )
+            self._fetches[job.presentation_id] = task
+        return await asyncio.shield(task)
+
+    async def _fetch(self, session, job):
+        entry = self.presentations.get(job.presentation_id)
+        headers = {}
+        if entry is not None and os.path.exists(self.pdf_path(entry["sha256"])):
+            if entry.get("etag"):
+                headers["If-None-Match"] = entry["etag"]
+            if entry.get("last_modified"):
+                headers["If-Modified-Since"] = entry["last_modified"]
+
+        async with session.get(job.download_url, headers=headers) as resp:
+            if resp.status == 304:
+                print(f"Slides for presentation {job.presentation_id} are unchanged.")
+                return entry["sha256"]
+            # Raises ClientResponseError; 429 and 5xx responses are retried.
+            resp.raise_for_status()
+            digest, tmp_path = await self._stream_to_disk(resp, job)
+            etag = resp.headers.get("ETag")
+            last_modified = resp.headers.get("Last-Modified")
+
+        pdf_file_path = self.pdf_path(digest)
+        if os.path.exists(pdf_file_path):
+            os.remove(tmp_path)  # Same content as a deck we already have.
+        else:
+            os.replace(tmp_path, pdf_file_path)
+        self.presentations[job.presentation_id] = {
+            "sha256": digest,
+            "etag": etag,
+            "last_modified": last_modified,
+        }
+        print(f"Downloaded slides PDF for presentation {job.presentation_id}.")
+        return digest
+
+    async def _stream_to_disk(self, resp, job):
+        """
+        Streams the response body in chunks to a temporary file in the cache,
+        hashing it on the way, so a deck is never held in memory. Aborts once
+        the body exceeds MAX_SLIDES_SIZE. Returns (sha256 hex digest, path).
+        """
+        max_bytes = MAX_SLIDES_SIZE * 1024 * 1024
+        if resp.content_length is not None and resp.content_length > max_bytes:
+            raise SlidesTooLargeError(
+                f"{resp.content_length} bytes exceeds the {MAX_SLIDES_SIZE} MB limit"
+            )
+
+        fd, tmp_path = tempfile.mkstemp(
+            dir=os.path.join(self.root, "pdf"), suffix=".part"
+        )
+        hasher = hashlib.sha256()
+        size = 0
+        try:
+            with os.fdopen(fd, "wb") as f:
+                async for chunk in resp.content.iter_chunked(DOWNLOAD_CHUNK_SIZE):
+                    size += len(chunk)
+                    if size > max_bytes:
+                        raise SlidesTooLargeError(
+                            f"download exceeds the {MAX_SLIDES_SIZE} MB limit"
+                        )
+                    hasher.update(chunk)
+                    f.write(chunk)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return hasher.hexdigest(), tmp_path
+
+    async def thumbnail(self, digest, pool, image_format, extension):
+        """Returns the cached thumbnail path, rendering it in the pool if needed."""
+        thumbnail_file_path = self.thumbnail_path(digest, extension)
+        if os.path.exists(thumbnail_file_path):
+            return thumbnail_file_path
+        task = self._renders.get(thumbnail_file_path)
+        if task is None:
+            task = asyncio.ensure_future(
+                self._render(digest, thumbnail_file_path, pool, image_format)
+            )
+            self._renders[thumbnail_file_path] = task
+        rendered = await asyncio.shield(task)
+        return thumbnail_file_path if rendered else None
+
+    async def _render(self, digest, thumbnail_file_path, pool, image_format):
+        # Timed here, once per thumbnail, including the wait for a free worker.
+        with metrics.timer("render thumbnail"):
+            return await asyncio.get_running_loop().run_in_executor(
+                pool,
+                render_thumbnail,
+                self.pdf_path(digest),
+                thumbnail_file_path,
+                THUMBNAIL_WIDTH,
+                image_format,
+            )
+
+    def save(self):
+        write_json_atomic(self.index_path, {"presentations": self.presentations})
+
+
+async def download_slides(jobs, cache=None):
+    """
+    Exports every job's deck through one pooled HTTP session, with at most
+    DOWNLOAD_CONCURRENCY downloads in flight. Each request has a
+    DOWNLOAD_TIMEOUT and transient failures are retried with backoff.
+    PDFs and thumbnails come from the content-addressed SlideCache and are
+    linked into the channel directories (jobs without one only fill in their
+    manifest entry); missing thumbnails are rendered by a pool of
+    THUMBNAIL_WORKERS processes, so poppler never blocks the event loop (and
+    the gateway).
+    """
+    image_format, extension = THUMBNAIL_FORMATS[THUMBNAIL_FORMAT.lower()]
+    connector = aiohttp.TCPConnector(limit=DOWNLOAD_CONCURRENCY)
+    timeout = aiohttp.ClientTimeout(total=DOWNLOAD_TIMEOUT)
+    if cache is None:
+        cache = SlideCache(SLIDES_CACHE_DIR)
+
+    async def export_slides(job):
+        try:
+            digest = await cache.fetch(session, job)
+        except Exception as e:
+            print(f"Error downloading slides PDF from {job.download_url}: {e}")
+            return
+        if job.refresh and job.entry.get("sha256") == digest:
+            return  # Unchanged since its export; the files are in place.
+        pdf_name = f"slides_{job.number}.pdf"
+        if job.channel_dir is not None:
+            link_artifact(
+                cache.pdf_path(digest), os.path.join(job.channel_dir, pdf_name)
+            )
+
+        # Extract thumbnail from the first page of the downloaded PDF.
+        try:
+            thumbnail_file_path = await cache.thumbnail(
+                digest, pool, image_format, extension
+            )
+        except Exception as e:
+            print(
+                f"Error converting PDF to image for presentation {job.presentation_id}: {e}"
+            )
+            return
+        if thumbnail_file_path is None:
+            print(
+                f"Could not extract an image from PDF for presentation {job.presentation_id}."
+            )
+            return
+        thumbnail_name = f"thumbnail_{job.number}.{extension}"
+        if job.channel_dir is not None:
+            link_artifact(
+                thumbnail_file_path, os.path.join(job.channel_dir, thumbnail_name)
+            )
+        if job.entry is not None:
+            job.entry["files"] = [pdf_name, thumbnail_name]
+            job.entry["sha256"] = digest
+        print(
+            f"Exported slides {job.number} for presentation {job.presentation_id} in channel '{job.channel_name}'."
+        )
+
+    with ProcessPoolExecutor(max_workers=THUMBNAIL_WORKERS) as pool:
+        async with aiohttp.ClientSession(
+            connector=connector,
+            timeout=timeout,
+            trace_configs=[metrics.trace_config()],
+        ) as session:
+            try:
+                await run_bounded(jobs, export_slides, limit=DOWNLOAD_CONCURRENCY)
+            finally:
+                cache.save()
+
+
+def write_bundle(path, channels, cache):
+    """
+    Writes the whole export as one zip file, streamed entry by entry: per
+    channel "{name}/pinned.txt" and the slides PDFs and thumbnails, copied
+    straight from the SlideCache (stored, not recompressed), plus an
+    "index.json" describing every channel and deck. Nothing is written
+    outside the archive. channels is a list of dicts with the channel's
+    "name", "record_id", "pinned" fields, "pinned_text" and manifest "slides".
+    The zip is built under a temporary name and renamed when complete.
+    """
+    index = {
+        "generated_at": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "channels": [],
+    }
+    tmp_path = f"{path}.tmp"
+    with zipfile.ZipFile(tmp_path, "w", compression=zipfile.ZIP_DEFLATED) as bundle:
+        for channel in channels:
+            name = channel["name"]
+            item = {
+                "name": name,
+                "record_id": channel["record_id"],
+                "pinned": channel["pinned"],
+                "pinned_file": None,
+                "slides": [],
+            }
+            if channel["pinned_text"] is not None:
+                item["pinned_file"] = f"{name}/pinned.txt"
+                bundle.writestr(item["pinned_file"], channel["pinned_text"])
+            for entry in channel["slides"]:
+                artifacts = cache.artifacts(entry)
+                if artifacts is None:
+                    continue  # Not exported (yet); the next run retries it.
+                pdf_name, thumbnail_name = (f"{name}/{f}" for f in entry["files"])
+                for source, arcname in zip(artifacts, (pdf_name, thumbnail_name)):
+                    bundle.write(source, arcname, compress_type=zipfile.ZIP_STORED)
+                item["slides"].append(
+                    {
+                        "number": entry["number"],
+                        "presentation_id": entry["presentation_id"],
+                        "message_id": entry["message_id"],
+                        "pdf": pdf_name,
+                        "thumbnail": thumbnail_name,
+                    }
+                )
+            index["channels"].append(item)
+        bundle.writestr("index.json", json.dumps(index, indent=2))
+    os.replace(tmp_path, path)
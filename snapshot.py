@@ -0,0 +1,107 @@
+import re
+from collections import defaultdict
+from dataclasses import dataclass
+
+from planner import fetch_bot_pins, parse_pinned_message
+
+# Channels created by --add are named "p{ID}-{name}"; a bare "p{ID}" counts too.
+PRESENTATION_CHANNEL_PATTERN = re.compile(r"^p(\d+)(?:-|$)")
+
+
+@dataclass(slots=True)
+class PresentationChannel:
+    """A presentation channel and what the bot pinned in it."""
+
+    channel: object
+    record_id: str
+    pin: object = None  # the bot's pinned message, if it has one
+    details: object = None  # PinnedDetails parsed from the pin
+    loaded: bool = False  # whether the pins were read successfully
+
+
+class GuildSnapshot:
+    """
+    The guild's presentation channels with the bot's pinned message in each.
+    All pins are fetched once, concurrently, and parsed into PinnedDetails;
+    the records are indexed by ID (what --moodle exports) and by presentation
+    date (the sessions of --stats). Every action reads from the snapshot
+    instead of fetching pins itself, and a long-running bot keeps one across
+    jobs.
+
+    refresh() brings it back in line with the client's channel cache (which
+    the gateway keeps current) and only fetches pins for channels it has not
+    seen yet or whose pins could not be read.
+    """
+
+    def __init__(self, guild, bot_user_id):
+        self.guild = guild
+        self.bot_user_id = bot_user_id
+        self.entries = {}  # channel id -> PresentationChannel, in guild order
+        self.by_id = {}  # record id -> PresentationChannel
+        self.by_date = {}  # presentation date -> [PresentationChannel]
+
+    @classmethod
+    async def load(cls, guild, bot_user_id):
+        snapshot = cls(guild, bot_user_id)
+        await snapshot.refresh()
+        return snapshot
+
+    @property
+    def channels(self):
+        return list(self.entries.values())
+
+    async def refresh(self):
+        entries = {}
+        for channel in self.guild.text_channels:
+            match = PRESENTATION_CHANNEL_PATTERN.match(channel.name)
+            if match is None:
+                continue
+            entry = self.entries.get(channel.id)
+            if entry is None:
+                entry = PresentationChannel(channel, match.group(1))
+            entry.channel = channel
+            entry.record_id = match.group(1)
+            entries[channel.id] = entry
+        self.entries = entries
+
+        pending = [entry.channel for entry in entries.values() if not entry.loaded]
+        if pending:
+            print(f"Reading pins in {len(pending)} presentation channels.")
+            bot_pins = await fetch_bot_pins(pending, self.bot_user_id)
+            for channel_id, pin in bot_pins.items():
+                entry = entries[channel_id]
+                entry.pin = pin
+                entry.details = parse_pinned_message(pin.content) if pin else None
+                entry.loaded = True
+
+        self.by_id = {}
+        self.by_date = defaultdict(list)
+        for entry in entries.values():
+            first = self.by_id.setdefault(entry.record_id, entry)
+            if first is not entry:
+                print(
+                    f"Channels '{first.channel.name}' and '{entry.channel.name}' "
+                    f"share ID {entry.record_id}; using '{first.channel.name}'."
+                )
+                continue
+            if entry.details is not None and entry.details.date is not None:
+                self.by_date[entry.details.date.date()].append(entry)
+
+    def invalidate(self, channel_ids):
+        """Marks the pins of these channels stale, e.g. after the bot edited them."""
+        for channel_id in channel_ids:
+            entry = self.entries.get(channel_id)
+            if entry is not None:
+                entry.loaded = False
+
+    def bot_pins(self, channels):
+        """
+        Returns channel id -> the bot's pinned message (or None) for those of
+        the given channels whose pins are in the snapshot.
+        """
+        pins = {}
+        for channel in channels:
+            entry = self.entries.get(channel.id)
+            if entry is not None and entry.loaded:
+                pins[channel.id] = entry.pin
+        return pins
@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+
+
+def load_json(path, default):
+    """Reads a JSON file, returning default if it is missing or unreadable."""
+    try:
+        with open(path, encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return default
+    except (OSError, ValueError) as e:
+        print(f"Ignoring unreadable state file '{path}': {e}")
+        return default
+
+
+def write_json_atomic(path, data):
+    """Writes JSON to a temporary file and moves it into place in one step."""
+    write_text_atomic(path, json.dumps(data, indent=2, sort_keys=True))
+
+
+def write_text_atomic(path, text):
+    """Writes text to a temporary file and moves it into place in one step."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def content_hash(content):
+    """Short, stable fingerprint of a pinned message's content."""
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()[:16]
+
+
+class StateCache:
+    """
+    On-disk record of what the bot last wrote to the guild, keyed by CSV record
+    ID: the channel id, the id of the bot's pinned message and a hash of its
+    content. It lets --add skip unchanged channels without any API call.
+
+    The cache is only a hint. Entries whose channel no longer matches the guild
+    are ignored, and rebuild() drops everything so it is repopulated from pins.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.records = load_json(path, {}).get("records", {})
+        self.dirty = False
+
+    def get(self, record_id):
+        return self.records.get(record_id)
+
+    def lookup(self, record_id, channel_id):
+        """Returns the entry for record_id if it still refers to channel_id."""
+        entry = self.records.get(record_id)
+        if entry is None or entry.get("channel_id") != channel_id:
+            return None
+        return entry
+
+    def set(self, record_id, channel_id, message_id, content):
+        entry = {
+            "channel_id": channel_id,
+            "message_id": message_id,
+            "content_hash": content_hash(content),
+        }
+        if self.records.get(record_id) != entry:
+            self.records[record_id] = entry
+            self.dirty = True
+
+    def forget(self, record_id):
+        if self.records.pop(record_id, None) is not None:
+            self.dirty = True
+
+    def rebuild(self):
+        """Drops every entry so the next plan re-reads pins from the guild."""
+        if self.records:
+            self.records = {}
+            self.dirty = True
+
+    def save(self):
+        if not self.dirty:
+            return
+        write_json_atomic(self.path, {"records": self.records})
+        self.dirty = False
+
+
+class HistoryCursors:
+    """
+    Per-channel progress of --stats: the id of the newest message already
+    counted and the activity aggregated so far (see stats.ChannelActivity). A
+    later run only reads messages after the cursor and merges them in.
+    The last name seen for every user id is kept for exporting.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        data = load_json(path, {})
+        self.channels = data.get("channels", {})
+        self.names = data.get("names", {})  # str(user id) -> last seen name
+
+    def get(self, channel_id):
+        """Returns (last_message_id, activity dict or None) for a channel."""
+        entry = self.channels.get(str(channel_id))
+        if entry is None or "activity" not in entry:
+            # Unknown channel, or a cursor written before activity was
+            # aggregated: scan the channel from the start.
+            return None, None
+        return entry["last_message_id"], entry["activity"]
+
+    def set(self, channel_id, last_message_id, activity):
+        self.channels[str(channel_id)] = {
+            "last_message_id": last_message_id,
+            "activity": activity,
+        }
+
+    def save(self):
+        write_json_atomic(self.path, {"channels": self.channels, "names": self.names})
+
+
+class ExportManifest:
+    """
+    Progress of --moodle for one channel directory ("manifest.json"): the id of
+    the newest message scanned for slide links and every deck found so far,
+    with the file names of the artifacts already produced for it. An entry is
+    only complete once all of its files exist, so an interrupted export picks
+    up exactly the decks it did not finish.
+    """
+
+    def __init__(self, channel_dir):
+        self.channel_dir = channel_dir
+        self.path = os.path.join(channel_dir, "manifest.json")
+        data = load_json(self.path, {})
+        self.last_message_id = data.get("last_message_id")
+        self.slides = data.get("slides", [])
+
+    def add_slides(self, presentation_id, message_id):
+        self.slides.append(
+            {
+                "number": len(self.slides) + 1,
+                "presentation_id": presentation_id,
+                "message_id": message_id,
+                "files": [],
+            }
+        )
+
+    def is_complete(self, entry):
+        files = entry.get("files", [])
+        return len(files) == 2 and all(
+            os.path.exists(os.path.join(self.channel_dir, name)) for name in files
+        )
+
+    def save(self):
+        write_json_atomic(
+            self.path,
+            {"last_message_id": self.last_message_id, "slides": self.slides},
+        )
@@ -0,0 +1,238 @@
+import importlib.util
+from array import array
+
+import numpy as np
+import pandas as pd
+
+# Formats of the long participation table (see STATS_LONG_FORMAT).
+LONG_FORMATS = ("parquet", "arrow", "csv")
+
+
+class ParticipationMatrix:
+    """
+    Who posted in which session, kept as (user row, session column) integer
+    pairs in compact arrays. Users are identified by id; display names are only
+    attached when exporting. The dense boolean matrix is built on demand.
+    """
+
+    def __init__(self):
+        self.user_ids = []  # row -> user id
+        self.sessions = []  # column -> session label
+        self._user_rows = {}  # user id -> row
+        self._rows = array("i")
+        self._cols = array("i")
+
+    def add_session(self, label, user_ids):
+        column = len(self.sessions)
+        self.sessions.append(label)
+        for user_id in user_ids:
+            row = self._user_rows.get(user_id)
+            if row is None:
+                row = self._user_rows[user_id] = len(self.user_ids)
+                self.user_ids.append(user_id)
+            self._rows.append(row)
+            self._cols.append(column)
+
+    def to_array(self):
+        matrix = np.zeros((len(self.user_ids), len(self.sessions)), dtype=bool)
+        rows = np.frombuffer(self._rows, dtype=np.intc)
+        cols = np.frombuffer(self._cols, dtype=np.intc)
+        matrix[rows, cols] = True
+        return matrix
+
+
+class ChannelActivity:
+    """
+    Streaming aggregates of one channel's history: message count and first/last
+    message time per user, and the number of messages per hour. Only counters
+    are kept, never the messages, and the whole thing round-trips through the
+    JSON cursor file so incremental runs can keep adding to it.
+    """
+
+    def __init__(self, data=None):
+        data = data or {}
+        # user id -> [message count, first timestamp, last timestamp] (epoch s)
+        self.users = {int(k): list(v) for k, v in data.get("users", {}).items()}
+        # start of the hour (epoch s) -> message count
+        self.hours = {int(k): v for k, v in data.get("hours", {}).items()}
+
+    def add(self, user_id, created_at):
+        timestamp = int(created_at.timestamp())
+        entry = self.users.get(user_id)
+        if entry is None:
+            self.users[user_id] = [1, timestamp, timestamp]
+        else:
+            entry[0] += 1
+            entry[1] = min(entry[1], timestamp)
+            entry[2] = max(entry[2], timestamp)
+        hour = timestamp - timestamp % 3600
+        self.hours[hour] = self.hours.get(hour, 0) + 1
+
+    def to_dict(self):
+        return {
+            "users": {str(k): v for k, v in self.users.items()},
+            "hours": {str(k): v for k, v in self.hours.items()},
+        }
+
+
+def resolve_names(user_ids, guild, known_names):
+    """
+    Maps user ids to display labels: the member's current name if they are
+    still in the guild, else the last name seen in a message. Names shared by
+    several users get the id appended so rows never collide.
+    """
+    names = {}
+    for user_id in user_ids:
+        member = guild.get_member(user_id)
+        if member is not None:
+            names[user_id] = member.name
+        else:
+            names[user_id] = known_names.get(str(user_id), str(user_id))
+
+    counts = {}
+    for name in names.values():
+        counts[name] = counts.get(name, 0) + 1
+    return {
+        user_id: name if counts[name] == 1 else f"{name} ({user_id})"
+        for user_id, name in names.items()
+    }
+
+
+def export_stats(matrix, names, rolling_window, prefix="stats"):
+    """
+    Writes the wide attendance table ("{prefix}.csv", one 0/1 column per
+    session) plus per-user totals ("{prefix}_users.csv") and per-session
+    attendance with a rolling attendance rate ("{prefix}_sessions.csv").
+    Returns the wide table.
+    """
+    attended = matrix.to_array()
+    labels = [names[user_id] for user_id in matrix.user_ids]
+    order = np.argsort(labels, kind="stable")
+
+    df = pd.DataFrame(
+        attended[order].astype(np.uint8),
+        index=pd.Index(np.asarray(labels, dtype=object)[order], name="User"),
+        columns=matrix.sessions,
+    )
+    csv_filename = f"{prefix}.csv"
+    df.to_csv(csv_filename)
+    print(f"Saved stats table to '{csv_filename}'.")
+
+    n_sessions = max(len(matrix.sessions), 1)
+    recent = attended[:, -rolling_window:]
+    users = pd.DataFrame(
+        {
+            "User ID": np.asarray(matrix.user_ids, dtype=np.int64)[order],
+            "Sessions Attended": attended.sum(axis=1)[order],
+            "Attendance Rate": (attended.sum(axis=1) / n_sessions)[order],
+            f"Attendance Rate (last {rolling_window})": (
+                recent.sum(axis=1) / max(recent.shape[1], 1)
+            )[order],
+        },
+        index=df.index,
+    )
+    users_filename = f"{prefix}_users.csv"
+    users.to_csv(users_filename)
+    print(f"Saved per-user totals to '{users_filename}'.")
+
+    n_users = max(len(matrix.user_ids), 1)
+    sessions = pd.DataFrame(
+        {"Attendees": attended.sum(axis=0)},
+        index=pd.Index(matrix.sessions, name="Session"),
+    )
+    sessions["Attendance Rate"] = sessions["Attendees"] / n_users
+    sessions["Rolling Attendance Rate"] = (
+        sessions["Attendance Rate"].rolling(rolling_window, min_periods=1).mean()
+    )
+    sessions_filename = f"{prefix}_sessions.csv"
+    sessions.to_csv(sessions_filename)
+    print(f"Saved per-session attendance to '{sessions_filename}'.")
+    return df
+
+
+def export_activity(sessions, names, prefix="stats"):
+    """
+    Writes the engagement tables for (session label, ChannelActivity) pairs:
+    per-user message counts with first/last activity ("{prefix}_messages.csv")
+    and the hourly message time series per session ("{prefix}_activity.csv").
+    Returns the per-user message counts.
+    """
+    columns = {k: [] for k in ("Session", "User", "User ID", "Messages")}
+    first, last = [], []
+    for label, activity in sessions:
+        for user_id, (count, first_ts, last_ts) in activity.users.items():
+            columns["Session"].append(label)
+            columns["User"].append(names.get(user_id, str(user_id)))
+            columns["User ID"].append(user_id)
+            columns["Messages"].append(count)
+            first.append(first_ts)
+            last.append(last_ts)
+    messages = pd.DataFrame(columns)
+    messages["First Message"] = pd.to_datetime(first, unit="s", utc=True)
+    messages["Last Message"] = pd.to_datetime(last, unit="s", utc=True)
+    messages_filename = f"{prefix}_messages.csv"
+    messages.to_csv(messages_filename, index=False)
+    print(f"Saved per-user message counts to '{messages_filename}'.")
+
+    columns = {"Session": [], "Hour": [], "Messages": []}
+    for label, activity in sessions:
+        for hour in sorted(activity.hours):
+            columns["Session"].append(label)
+            columns["Hour"].append(hour)
+            columns["Messages"].append(activity.hours[hour])
+    hourly = pd.DataFrame(columns)
+    hourly["Hour"] = pd.to_datetime(hourly["Hour"], unit="s", utc=True)
+    activity_filename = f"{prefix}_activity.csv"
+    hourly.to_csv(activity_filename, index=False)
+    print(f"Saved hourly activity to '{activity_filename}'.")
+    return messages
+
+
+def export_long(messages, sessions, prefix="stats", long_format=None):
+    """
+    Writes participation in long (tidy) form: one row per user and session
+    they posted in, with the session's date, record id and channel next to the
+    message counts. The columns are typed (timestamps, integer ids,
+    categorical labels), so "{prefix}_long.parquet" (or ".arrow" for the Arrow
+    IPC format) loads quickly and the files of several runs or terms can be
+    concatenated as they are. sessions maps each session label to its
+    (date, record id, channel name). Without a long_format, Parquet is written
+    if pyarrow is installed and "{prefix}_long.csv" otherwise.
+    """
+    has_pyarrow = importlib.util.find_spec("pyarrow") is not None
+    if long_format is None:
+        long_format = "parquet" if has_pyarrow else "csv"
+    if long_format not in LONG_FORMATS:
+        print(
+            f"Unknown long table format '{long_format}'; expected one of {LONG_FORMATS}."
+        )
+        return
+    if long_format != "csv" and not has_pyarrow:
+        print(
+            "Writing Parquet or Arrow files requires pyarrow "
+            "(poetry install --extras stats); writing CSV instead."
+        )
+        long_format = "csv"
+
+    labels = messages["Session"]
+    long = pd.DataFrame(
+        {
+            "Session": labels.astype("category"),
+            "Date": pd.to_datetime([sessions[label][0] for label in labels]),
+            "Record ID": [sessions[label][1] for label in labels],
+            "Channel": pd.Categorical([sessions[label][2] for label in labels]),
+            "User ID": messages["User ID"].astype(np.int64),
+            "User": messages["User"],
+            "Messages": messages["Messages"].astype(np.int32),
+            "First Message": messages["First Message"],
+            "Last Message": messages["Last Message"],
+        }
+    )
+    long_filename = f"{prefix}_long.{long_format}"
+    if long_format == "parquet":
+        long.to_parquet(long_filename, index=False)
+    elif long_format == "arrow":
+        long.to_feather(long_filename)
+    else:
+        long.to_csv(long_filename, index=False)
+    print(f"Saved long-format participation to '{long_filename}'.")